@@ -2,123 +2,102 @@
     Program to add newly exported transaction data to an existing local
     csv file of transaction data in mint format
 """
-import pandas as pd
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Local helper modules
 import read_mint_transaction_data as rmtd
 import get_lunchmoney_transactions as glt
 import process_empower_transactions as pet
+import recategorization_rules as rr
+import resolve_transaction_conflicts as rtc
+import search_transactions as st
+import profile_stages as ps
 import expenses_config as ec
 
+# Columns that identify a transaction when looking for possible duplicates
+FINGERPRINT_COLUMNS = ["Date", "Amount", "Account Name", "Transaction Type"]
 
-def add_row_if_unique(old_df, row, verbose=True):
+
+def build_fingerprint_index(df):
+    """
+    Returns a dict that maps the fingerprint of each transaction, ie: its
+    (Date, Amount, Account Name, Transaction Type), to the list of the
+    positions in df of the transactions that share that fingerprint
+    """
+    if df.empty:
+        return {}
+    return {
+        key: list(positions)
+        for key, positions in df.groupby(
+            FINGERPRINT_COLUMNS, sort=False
+        ).indices.items()
+    }
+
+
+@ps.profile_stage("merge")
+def add_new_transactions(
+    new_df, old_df, outfile, prefix="", verbose=True, fingerprints=None
+):
     """
-    Check if a given transaction exists in a dataframe of existing
-    transaction data.  If it is completely unique, add it.
-    If it is similar to an existing transaction ask the user how to
-    process it.
+    Adds the new transactions that aren't already in the existing transaction
+    data, and writes the result out.  The possible duplicates are collected
+    and resolved together before any changes are made
 
     Params:
+        new_df - newly exported transaction data dataframe
         old_df - existing transaction data dataframe
-        row - series with one potential new transaction
-
-    Returns:
-        an updated or unchanged dataframe of existing transaction data
-        a boolean that indicates if a previously existing entry was updated
+        fingerprints - optional index of old_df built by build_fingerprint_index
     """
-    did_overwrite = False
-    # Find any existing transactions with the same Date, Amount, Account Name,
-    # and Transaction Type that are in the new transaction being analyzed
-    unique_match = old_df[
-        (old_df["Date"] == row["Date"])
-        & (old_df["Amount"] == row["Amount"])
-        & (old_df["Account Name"] == row["Account Name"])
-        & (old_df["Transaction Type"] == row["Transaction Type"])
-    ]
-    if not unique_match.empty:
-        # Row is not unique based on Date, Amount, Account Name & Trans Type
-        # Check if Description and Category columns are different
-        desc_cat_change = unique_match[
-            (unique_match["Description"] != row["Description"])
-            | (unique_match["Category"] != row["Category"])
-        ]
-        if not desc_cat_change.empty:
-            # Possible duplicate entry with new Description and/or Category
-            print(
-                "\nFound a possible duplicate entry with new Description and/or Category."  # noqa
-            )
-            print(
-                "{} {} {} {:.2f}".format(
-                    row["Date"].strftime("%Y-%m-%d"),
-                    row["Account Name"],
-                    row["Transaction Type"],
-                    row["Amount"],
-                )
-            )
-            print("Existing Description and Category:")
-            print(unique_match.iloc[0][["Description", "Category"]].values)
-            print("New Description and Category:")
-            print(row[["Description", "Category"]].values)
-            response = input("(O)verwrite, (A)dd as new, or (I)gnore?")
-            if response.lower() == "o":
-                # Update existing transactions with the new info
-                old_df.loc[unique_match.index, ["Description", "Category"]] = [
-                    row["Description"],
-                    row["Category"],
-                ]
-                did_overwrite = True
-            elif response.lower() == "a":
-                # Add row as a new transactions to the existing data
-                old_df = pd.concat([old_df, row.to_frame().T], ignore_index=True)
-            else:
-                # Ignore the new transaction's updated info
-                return old_df, False
-        else:
-            # Row already in transaction data, skip it
-            return old_df, False
-    else:
-        # Row is not in existing transaction data, add it
-        if verbose:
-            print("Found New Transaction:")
-            print(
-                "{}: {} : {} {} {:.2f}".format(
-                    row["Date"].strftime("%Y-%m-%d"),
-                    row["Description"],
-                    row["Category"],
-                    row["Transaction Type"],
-                    row["Amount"],
-                )
-            )
-        old_df = pd.concat([old_df, row.to_frame().T], ignore_index=True)
-
-    return old_df, did_overwrite
-
-
-def add_new_transactions(new_df, old_df, outfile, prefix="", verbose=True):
     # Unindex the dataframes if they were indexed
     if old_df.index.name is not None:
         old_df.reset_index(inplace=True)
+        fingerprints = None
     if new_df.index.name is not None:
         new_df.reset_index(inplace=True)
-
-    # Apply add_row_if_unique function to each row in empower_df
-    num_overwritten = 0
+    if fingerprints is None:
+        fingerprints = build_fingerprint_index(old_df)
+
+    (to_add, conflicts) = rtc.find_conflicts(
+        new_df, old_df, fingerprints, FINGERPRINT_COLUMNS
+    )
+    # Add the new transactions first, since some of the conflicts may be
+    # between the new transactions
     orig_len = len(old_df)
-    for index, row in new_df.iterrows():
-        old_df, did_overwrite = add_row_if_unique(old_df, row)
-        if did_overwrite:
-            num_overwritten += 1
+    old_df = rtc.append_transactions(old_df, new_df, to_add)
+    actions = rtc.resolve_conflicts(
+        conflicts,
+        new_df,
+        old_df,
+        rtc.decisions_file(outfile, prefix),
+        rtc.read_conflict_policy(),
+    )
+    old_df, num_overwritten = rtc.apply_resolutions(new_df, old_df, conflicts, actions)
 
     if verbose:
-        num_added = len(old_df) - orig_len
-        print(f"\nAdded {num_added} new transactions")
-        if num_overwritten:
-            print(f"and updated {num_overwritten} existing transactions")
-        print(
-            f"{len(new_df) - num_added - num_overwritten} transactions "
-            "in the new export already existed in the existing transaction data"
-        )
+        # Print under the prompt lock so the output isn't mixed in with the
+        # review of another transaction file's possible duplicates
+        with rtc.prompt_lock:
+            for _, row in new_df.iloc[to_add].iterrows():
+                print("Found New Transaction:")
+                print(
+                    "{}: {} : {} {} {:.2f}".format(
+                        row["Date"].strftime("%Y-%m-%d"),
+                        row["Description"],
+                        row["Category"],
+                        row["Transaction Type"],
+                        row["Amount"],
+                    )
+                )
+            num_added = len(old_df) - orig_len
+            print(f"\nAdded {num_added} new transactions")
+            if num_overwritten:
+                print(f"and updated {num_overwritten} existing transactions")
+            print(
+                f"{len(new_df) - num_added - num_overwritten} transactions "
+                "in the new export already existed in the existing transaction data"
+            )
 
     # Sort and index merged dataframe by descending date
     df = old_df.sort_values(by="Date", ascending=False)
@@ -126,54 +105,100 @@ def add_new_transactions(new_df, old_df, outfile, prefix="", verbose=True):
 
     # Write updated mint_df to new CSV file
     rmtd.output_new_transaction_data(df, outfile, prefix)
+
+    # Index the descriptions of the new and changed transactions for searching
+    st.update_search_index(df, st.search_index_file(outfile, prefix), verbose)
     return df
 
 
-def add_new_and_return_all(trans, new_trans=None):
-    # Get newly exported transaction data
-    if ec.NEW_TRANSACTION_SOURCE == "mint":
-        new_df = rmtd.read_mint_transaction_csv(new_trans, index_on_date=False)
+def load_transactions(trans):
+    """
+    Reads a local csv of transaction data and builds the fingerprint index
+    used to look for possible duplicates when new transactions are added
+    """
+    old_df = rmtd.read_mint_transaction_csv(
+        trans, index_on_date=False, check_for_latest=False
+    )
+    return old_df, build_fingerprint_index(old_df)
+
+
+def get_new_transactions(trans, new_trans):
+    """Returns the new transactions to add in mint format"""
+    if new_trans is not None and rmtd.is_transaction_export_collection(new_trans):
+        return rmtd.read_transaction_exports(new_trans)
+    elif ec.NEW_TRANSACTION_SOURCE == "mint":
+        return rmtd.read_mint_transaction_csv(
+            new_trans, index_on_date=False, check_for_latest=False
+        )
     elif ec.NEW_TRANSACTION_SOURCE == "empower":
-        new_df = pet.empower_to_mint_format(new_trans)
+        return pet.empower_to_mint_format(new_trans)
     elif ec.NEW_TRANSACTION_SOURCE == "lunchmoney":
-        old_df = rmtd.read_mint_transaction_csv(trans, index_on_date=False)
-        new_df = glt.get_latest_good_lm_transactions(old_df)
+        # Only the latest date is needed to start the fetch, so it is read from
+        # the transaction file's metadata rather than waiting for the full read
+        most_recent_date = rmtd.get_latest_transaction_date(trans)
+        return glt.get_latest_good_lm_transactions(most_recent_date)
     else:
         print(
             f"No support for transactions in {ec.NEW_TRANSACTION_SOURCE} format yet."
         )  # noqa
         sys.exit(-1)
 
-    # If configured split the transaction data and add it to the accumulated
-    # transaction data for the user and the third party
-    if hasattr(ec, "THIRD_PARTY_ACCOUNTS") and hasattr(ec, "THIRD_PARTY_PREFIX"):
-        print("Splitting out the transactions for the 3rd party accounts...")
-        (my_df, their_df) = rmtd.extract_accounts(new_df, ec.THIRD_PARTY_ACCOUNTS)
-        if len(their_df):
+
+def add_new_and_return_all(trans, new_trans=None):
+    # Choose which copies of the local transaction data to use up front, since
+    # this may prompt the user, and the rest of the work is done in the background
+    ledgers = rmtd.get_account_ledgers()
+    ledger_files = {"": rmtd.get_latest_transaction_file(trans)}
+    for prefix in ledgers:
+        ledger_files[prefix] = rmtd.get_latest_transaction_file(
+            f"{prefix}-{ec.PATH_TO_YOUR_TRANSACTIONS}"
+        )
+
+    with ThreadPoolExecutor() as pool:
+        # Get newly exported transaction data while the existing transaction
+        # data is read and indexed
+        new_future = pool.submit(get_new_transactions, ledger_files[""], new_trans)
+        load_futures = {
+            prefix: pool.submit(load_transactions, ledger_file)
+            for prefix, ledger_file in ledger_files.items()
+            if os.path.isfile(ledger_file)
+        }
+        new_df = new_future.result()
+        new_df = rr.apply_category_rules(new_df)
+
+        # If configured split the transaction data so that it can be added to
+        # the accumulated transaction data for the user and each third party
+        if len(ledgers):
             print(
-                f"\nProcessing {len(their_df)} new transactions for "
-                f"{ec.THIRD_PARTY_PREFIX}..."
+                f"Splitting out the transactions for the accounts in {len(ledgers)} "
+                "other transaction files..."
             )
-            their_old_df = rmtd.read_mint_transaction_csv(
-                f"{ec.THIRD_PARTY_PREFIX}-{ec.PATH_TO_YOUR_TRANSACTIONS}",
-                index_on_date=False,
-            )
-            add_new_transactions(
-                their_df,
-                their_old_df,
+        parts = rmtd.route_accounts(new_df, ledgers)
+
+        # Add new or changed transactions to each set of accumulated data
+        merge_futures = {}
+        for prefix, part_df in parts.items():
+            if prefix == "":
+                print(f"\n\nProcessing your {len(part_df)} new transactions...")
+            elif len(part_df):
+                print(f"\nProcessing {len(part_df)} new transactions for {prefix}...")
+            else:
+                continue
+            if prefix in load_futures:
+                (old_df, fingerprints) = load_futures[prefix].result()
+            else:
+                (old_df, fingerprints) = load_transactions(ledger_files[prefix])
+            merge_futures[prefix] = pool.submit(
+                add_new_transactions,
+                part_df,
+                old_df,
                 ec.PATH_TO_YOUR_TRANSACTIONS,
-                ec.THIRD_PARTY_PREFIX,
+                prefix,
+                fingerprints=fingerprints,
             )
+        dfs = {prefix: future.result() for prefix, future in merge_futures.items()}
 
-        print(f"\n\nProcessing your {len(my_df)} new transactions...")
-        old_df = rmtd.read_mint_transaction_csv(trans, index_on_date=False)
-        df = add_new_transactions(my_df, old_df, ec.PATH_TO_YOUR_TRANSACTIONS)
-    else:
-        # Add new or changed transactions to accumulated data
-        old_df = rmtd.read_mint_transaction_csv(trans, index_on_date=False)
-        df = add_new_transactions(new_df, old_df, ec.PATH_TO_YOUR_TRANSACTIONS)
-
-    return df
+    return dfs[""]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""aggregate_cube.py
+
+    Summarize the extracted spending and income once, so that the reports don't
+    have to read every transaction again.
+
+    extract_spending_and_income.py writes the total Amount and the number of
+    transactions (Count) for each combination of:
+    - Kind: "spending" or "income"
+    - Month: ie: 2024-03
+    - Spending Group
+    - Category
+    - Account Name
+    to the gzipped csv in PATH_TO_AGGREGATES.  The reports read it and sum up
+    the slice they need, ie: the annual spending by Spending Group, so the time
+    to generate them depends on the number of groups, categories and accounts
+    rather than the number of transactions.
+
+    Usage:
+        python aggregate_cube.py [--income] [--by COLUMN ...]
+    Prints the annual totals by the given columns, ie: --by "Account Name"
+"""
+import argparse
+import pandas as pd
+
+# Import local helper modules
+import aggregate_periods as ap
+import profile_stages as ps
+
+# Import the shared configuration file
+import expenses_config as ec
+
+CUBE_DIMENSIONS = ["Kind", "Month", "Spending Group", "Category", "Account Name"]
+CUBE_VALUES = ["Amount", "Count"]
+PATH_TO_AGGREGATES = getattr(ec, "PATH_TO_AGGREGATES", "aggregates.csv.gz")
+
+
+def build_cube(extracted):
+    """Returns a dataframe with the total Amount and Count of the transactions
+    for each combination of the CUBE_DIMENSIONS
+
+    extracted - a dict mapping each Kind, ie: "spending", to a dataframe of the
+                extracted transactions indexed by Date with "YYYY Amount" columns
+    """
+    cubes = []
+    for kind, df in extracted.items():
+        df = ap.get_amounts(df)
+        df["Kind"] = kind
+        df["Month"] = ap.get_period_codes(df.index, "month")
+        totals = df.groupby(CUBE_DIMENSIONS, dropna=False)["Amount"].agg(
+            ["sum", "count"]
+        )
+        cubes.append(totals.set_axis(CUBE_VALUES, axis=1).reset_index())
+    return pd.concat(cubes, ignore_index=True)
+
+
+def write_cube(cube, path=None):
+    """Writes the cube to a csv, which is compressed if the path ends in .gz"""
+    path = path or PATH_TO_AGGREGATES
+    print(f"Writing {len(cube)} aggregates to {path}")
+    with ps.stage("write", rows_in=len(cube), files_written=[path]):
+        cube.to_csv(path, index=False)
+
+
+def read_cube(path=None):
+    """Returns the cube written by extract_spending_and_income.py, with a Year
+    column added.  Exits if it is older than the raw transaction data
+    """
+    # Imported here since only the reports need to check the extracted data
+    import visualization_methods as vms
+
+    path = path or PATH_TO_AGGREGATES
+    vms.check_structured_transactions(
+        path, ec.PATH_TO_YOUR_TRANSACTIONS, "aggregated transaction data"
+    )
+    print("Reading aggregated transaction data from " + path)
+    with ps.stage("read", files_read=[path]) as s:
+        cube = pd.read_csv(path, dtype={"Month": str})
+        cube["Year"] = cube["Month"].str[:4].astype(int)
+        s.rows_out = len(cube)
+    return cube
+
+
+def select(cube, kind=None, filters=None):
+    """Returns the rows of the cube of the given Kind that match the filters
+
+    filters - a dict mapping a column to a value or a list of values
+    """
+    mask = pd.Series(True, index=cube.index)
+    if kind is not None:
+        mask &= cube["Kind"] == kind
+    for column, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= cube[column].isin(values)
+    return cube[mask]
+
+
+def get_annual_totals(
+    cube, kind="spending", by="Spending Group", filters=None, values="Amount"
+):
+    """Returns a dataframe indexed by the by column(s) with a "YYYY Amount"
+    column, or "YYYY Count" column, for each year in year order.  This is the
+    same as summing the extracted "YYYY Amount" columns by Spending Group
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    df = select(cube, kind, filters)
+    totals = df.groupby(by + ["Year"])[values].sum().unstack("Year", fill_value=0)
+    totals.columns = [f"{year} {values}" for year in totals.columns]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Summarize the aggregated transactions in {PATH_TO_AGGREGATES}"
+    )
+    parser.add_argument(
+        "--income", action="store_true", help="summarize income instead of spending"
+    )
+    parser.add_argument(
+        "--by",
+        nargs="+",
+        default=["Spending Group"],
+        choices=CUBE_DIMENSIONS[2:],
+        help="the columns to summarize by",
+    )
+    parser.add_argument(
+        "--count", action="store_true", help="show the number of transactions"
+    )
+    args = parser.parse_args()
+
+    totals = get_annual_totals(
+        read_cube(),
+        "income" if args.income else "spending",
+        args.by,
+        values="Count" if args.count else "Amount",
+    )
+    totals.loc[("Total",) * len(args.by) if len(args.by) > 1 else "Total"] = (
+        totals.sum()
+    )
+    float_format = "{:,.0f}".format if args.count else "${:,.2f}".format
+    print(totals.to_string(float_format=float_format))
+
+
+if __name__ == "__main__":
+    main()
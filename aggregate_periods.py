@@ -0,0 +1,121 @@
+"""aggregate_periods.py
+
+    Summarize spending or income by Spending Group for periods other than the
+    calendar year, ie: to see the trends within a year.  Supported periods are:
+    - "month": ie: 2024-03
+    - "quarter": ie: 2024-Q1
+    - "fiscal year": named for the calendar year it ends in, ie: FY2025,
+      starting in FISCAL_YEAR_START_MONTH
+    - "rolling 12 months": the 12 months ending in each month, ie: 12M-2024-03
+    - "year": ie: 2024
+
+    The period of each transaction is computed once, and all of the groups and
+    periods are summed with a single groupby.
+
+    extract_spending_and_income.py writes the totals for the PERIOD_AGGREGATION
+    period to PATH_TO_SPENDING_BY_PERIOD and OUTPUT_INCOME_BY_PERIOD.  Other
+    periods can be printed from the extracted data without extracting it again.
+
+    Usage:
+        python aggregate_periods.py [--period PERIOD] [--income] [--output CSV]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+# Import the shared configuration file
+import expenses_config as ec
+
+PERIODS = ["month", "quarter", "fiscal year", "rolling 12 months", "year"]
+PERIOD_AGGREGATION = getattr(ec, "PERIOD_AGGREGATION", "month")
+FISCAL_YEAR_START_MONTH = getattr(ec, "FISCAL_YEAR_START_MONTH", 1)
+
+
+def get_period_codes(dates, period=PERIOD_AGGREGATION, fiscal_start=None):
+    """Returns an array with the code of the period that each date is in.
+    Codes of the same kind of period sort in date order
+
+    dates - the transaction dates
+    period - one of PERIODS.  For "rolling 12 months" each date's month is
+             returned, since each month is part of 12 different periods
+    fiscal_start - the month the fiscal year starts in
+    """
+    if fiscal_start is None:
+        fiscal_start = FISCAL_YEAR_START_MONTH
+    dates = pd.DatetimeIndex(dates)
+    years = dates.year.to_numpy()
+    months = dates.month.to_numpy()
+    if period in ("month", "rolling 12 months"):
+        return np.char.add(
+            np.char.add(years.astype(str), "-"),
+            np.char.zfill(months.astype(str), 2),
+        )
+    if period == "quarter":
+        quarters = ((months - 1) // 3 + 1).astype(str)
+        return np.char.add(np.char.add(years.astype(str), "-Q"), quarters)
+    if period == "fiscal year":
+        fiscal_years = years + ((months >= fiscal_start) & (fiscal_start != 1))
+        return np.char.add("FY", fiscal_years.astype(str))
+    if period == "year":
+        return years.astype(str)
+    raise ValueError(f'Unknown period "{period}", use one of {PERIODS}')
+
+
+def aggregate_by_period(
+    df, period=PERIOD_AGGREGATION, by="Spending Group", fiscal_start=None
+):
+    """Returns a dataframe with the total Amount for each value of the by
+    column (rows) in each period (columns), in date order
+
+    df - a dataframe of transactions indexed by Date with an Amount column
+    """
+    codes = get_period_codes(df.index, period, fiscal_start)
+    totals = df.groupby([df[by], pd.Series(codes, index=df.index, name="Period")])[
+        "Amount"
+    ].sum()
+    totals = totals.unstack("Period", fill_value=0).sort_index(axis=1)
+
+    if period == "rolling 12 months" and not totals.empty:
+        # Fill in months without any transactions so each window is 12 months
+        months = pd.period_range(totals.columns[0], totals.columns[-1], freq="M")
+        totals = totals.reindex(columns=months.astype(str), fill_value=0)
+        totals = totals.T.rolling(12, min_periods=12).sum().T.iloc[:, 11:]
+        totals.columns = [f"12M-{month}" for month in totals.columns]
+    return totals
+
+
+def get_amounts(df):
+    """Returns the extracted spending or income data with a single Amount
+    column in place of the "YYYY Amount" columns
+    """
+    year_columns = df.filter(regex=r"^\d{4} Amount$").columns
+    amounts = df[year_columns].sum(axis=1, min_count=1)
+    df = df.drop(columns=year_columns)
+    df["Amount"] = amounts
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the extracted spending or income by period"
+    )
+    parser.add_argument("--period", choices=PERIODS, default=PERIOD_AGGREGATION)
+    parser.add_argument(
+        "--income", action="store_true", help="summarize income instead of spending"
+    )
+    parser.add_argument("--output", help="write the summary to this csv")
+    args = parser.parse_args()
+
+    path = ec.OUTPUT_INCOME_DATA if args.income else ec.PATH_TO_SPENDING_DATA
+    print(f"Reading extracted transactions from {path}")
+    df = pd.read_csv(path, index_col="Date", parse_dates=["Date"])
+    totals = aggregate_by_period(get_amounts(df), args.period)
+    totals.loc["Total"] = totals.sum()
+    print(totals.T.to_string(float_format="${:,.2f}".format))
+    if args.output:
+        print(f"Writing the summary to {args.output}")
+        totals.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""convert_currency.py
+
+    Convert the amounts of transactions in other currencies to BASE_CURRENCY,
+    so that all the spending and income can be added up.
+
+    Transactions from LunchMoney have a "Currency" column.  Transactions
+    without a currency are assumed to be in BASE_CURRENCY already.  The
+    exchange rates are read from the csv in PATH_TO_FX_RATES, with a row for
+    each Date and Currency and the value of one unit of that currency in
+    BASE_CURRENCY in the "Rate" column.  See fx-rates-template.csv for an
+    example.  Each transaction uses the most recent rate on or before its date,
+    or the first rate if it is older than all of them.
+
+    The converted amounts replace the Amount, and the amounts before they were
+    converted are kept in the "Original Amount" column.
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Import shared configuration file
+import expenses_config as ec
+
+BASE_CURRENCY = getattr(ec, "BASE_CURRENCY", "USD")
+FX_RATE_COLUMNS = ["Date", "Currency", "Rate"]
+
+_fx_rates = {}
+
+
+def read_fx_rates(path=None):
+    """Returns a dataframe of the exchange rates sorted by Date.  Each rates
+    file is only read once unless it is modified
+    """
+    path = path or getattr(ec, "PATH_TO_FX_RATES", None)
+    if path is None:
+        print(
+            "Set PATH_TO_FX_RATES in expenses_config.py to convert transactions "
+            f"in other currencies to {BASE_CURRENCY}"
+        )
+        sys.exit(-1)
+    if not os.path.isfile(path):
+        print(f"No exchange rates to {BASE_CURRENCY} found in {path}")
+        print(f"Add the rates to {path} and try again.")
+        sys.exit(-1)
+    mtime = os.path.getmtime(path)
+    if path not in _fx_rates or _fx_rates[path][0] != mtime:
+        try:
+            rates = pd.read_csv(path, parse_dates=["Date"])
+        except BaseException as e:
+            print("Failed to read exchange rates from", path, file=sys.stderr)
+            print("The exception: {}".format(e), file=sys.stderr)
+            raise e
+        rates = rates.reindex(columns=FX_RATE_COLUMNS).dropna()
+        rates["Currency"] = rates["Currency"].str.strip().str.upper()
+        _fx_rates[path] = (mtime, rates.sort_values("Date", kind="stable"))
+    return _fx_rates[path][1]
+
+
+def convert_to_base_currency(df, path=None, base_currency=None):
+    """Converts the Amount of the transactions in other currencies to the base
+    currency, and keeps the amounts before they were converted in the
+    "Original Amount" column.  The rates for all of the transactions are looked
+    up at once with an as-of join on Date for each Currency
+    """
+    if "Currency" not in df.columns:
+        return df
+    base_currency = (base_currency or BASE_CURRENCY).upper()
+    # Transactions without a currency, ie: from mint, are in the base currency
+    currencies = df["Currency"].fillna(base_currency).astype(str)
+    currencies = currencies.str.strip().str.upper()
+    foreign = (currencies != base_currency).to_numpy()
+    if not foreign.any():
+        return df
+    rates = read_fx_rates(path)
+
+    dates = df.index if df.index.name == "Date" else df["Date"]
+    to_convert = pd.DataFrame(
+        {
+            "Date": pd.to_datetime(np.asarray(dates)[foreign]),
+            "Currency": currencies.to_numpy()[foreign],
+            "Position": np.flatnonzero(foreign),
+        }
+    )
+    to_convert = to_convert.sort_values("Date", kind="stable").reset_index(drop=True)
+    matched = pd.merge_asof(to_convert, rates, on="Date", by="Currency")
+    too_old = matched["Rate"].isna()
+    if too_old.any():
+        # Use the first rate for transactions from before the rates start
+        first_rates = pd.merge_asof(
+            to_convert[too_old], rates, on="Date", by="Currency", direction="forward"
+        )
+        matched.loc[too_old, "Rate"] = first_rates["Rate"].to_numpy()
+    missing = matched.loc[matched["Rate"].isna(), "Currency"].unique()
+    if len(missing):
+        print(f"No exchange rates to {base_currency} found for: {list(missing)}")
+        print(f"Add them to {path or ec.PATH_TO_FX_RATES} and try again.")
+        sys.exit(-1)
+
+    factors = np.ones(len(df))
+    factors[matched["Position"].to_numpy()] = matched["Rate"].to_numpy()
+    df["Original Amount"] = df["Amount"]
+    df["Amount"] = df["Amount"] * factors
+    print(f"Converted {foreign.sum()} transactions to {base_currency}")
+    return df
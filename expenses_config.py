@@ -16,6 +16,10 @@ PATH_TO_YOUR_TRANSACTIONS = "transactions.csv"
 NEW_TRANSACTION_SOURCE = "lunchmoney"
 
 # File with new transaction data - ignored if NEW_TRANSACTION_SOURCE is lunchmoney
+# This can also be a directory, or a glob pattern like "exports/*.csv", of
+# overlapping mint, empower or lunchmoney cache exports.  The format of each file
+# is detected from its header, and transactions found in more than one file
+# are only added once.
 PATH_TO_NEW_TRANSACTIONS = "mint-transactions.csv"
 
 # Lunchmoney API Key for fetching new transactions - https://my.lunchmoney.app/developer
@@ -26,8 +30,28 @@ LUNCHMONEY_API_TOKEN = "<YOUR API KEY>"
 # and amount, but different categories or descriptions are interactively resolved
 # in the terminal when the exptract_spending_and_income script is run
 LOOKBACK_TRANSACTION_DAYS = 7
+# Possible duplicates found when new transactions are added are resolved together.
+# Optionally resolve them with the first matching rule in a policy file whose
+# columns are Account Name, Category (blank matches any) and Action, which is one
+# of prefer-new, prefer-old or keep-both.  Any that are left are reviewed in the
+# terminal, and your answers are saved next to the transaction file, ie:
+# transactions.decisions.json, so they don't need to be answered again
+# See conflict-policy-template.csv for an example
+# PATH_TO_CONFLICT_POLICY = "./conflict-policy.csv"
 # Local cache of fetched transactions, handy for interative development
 LM_FETCHED_TRANSACTIONS_CACHE = "/tmp/lm_transactions"
+# Local cache of the lunchmoney categories so that each run doesn't need to
+# refetch them.  The cache is refreshed once it is older than the TTL.
+# Delete this file if you change your categories in the Lunch Money app
+LM_CATEGORIES_CACHE = "/tmp/lm_categories.json"
+LM_CATEGORIES_CACHE_TTL_HOURS = 24
+
+# Transactions from Lunch Money keep their currency.  Amounts in any other
+# currency than BASE_CURRENCY are converted to it using the exchange rates in
+# PATH_TO_FX_RATES, a csv with the value of one unit of each currency in
+# BASE_CURRENCY by date.  See fx-rates-template.csv for an example
+BASE_CURRENCY = "USD"
+# PATH_TO_FX_RATES = "./fx-rates.csv"
 
 
 # Empower supports fewer categories than mint, but doesn't appear to limit tags
@@ -46,6 +70,15 @@ USE_EMPOWER_LABELS = "true"
 # See mint-spending-groups-template.csv for an example
 PATH_TO_SPENDING_GROUPS = "./mint-spending-groups.csv"
 
+# Optional input file of rules that fix the Category, Spending Group or merchant
+# name of transactions whose Description matches a regular expression, ignoring
+# case.  When several rules match a transaction the first one wins.  Categories
+# are fixed as new transactions are added, and Spending Groups whenever the
+# categories are grouped.  Run recategorization_rules.py to see what each rule
+# matches in your transaction data.
+# See recategorization-rules-template.csv for an example
+# PATH_TO_RECATEGORIZATION_RULES = "./recategorization-rules.csv"
+
 # Input file describing Mint categories to exclude from spending analysis
 # This is a CSV file that describes the Spending Groups whose transctions will
 # be removed from the spending data.  This is typically Income, Credit Card
@@ -81,6 +114,13 @@ THIRD_PARTY_ACCOUNTS = [
 # transaction file with the specified prefix, eg: granny-transactions.csv
 # Subsequent runs can specify this transaction file for analysis
 THIRD_PARTY_PREFIX = "granny"
+# Transactions for any number of other accounts can also be routed to their own
+# transaction files.  Each key is the prefix of a transaction file, and its value
+# is the list of accounts whose transactions are written to that file
+# ACCOUNT_LEDGERS = {
+#     "business": ["Business Checking", "Business Visa"],
+#     "rental": ["Rental Property Checking"],
+# }
 
 # When predicting future spending, the tools will use the averages
 # of previous years' spending.  In order to not skew the numbers,
@@ -98,10 +138,88 @@ date = currentDateTime.date()
 CURRENT_YEAR = int(date.strftime("%Y"))
 # CURRENT_YEAR = 2999
 
+# Settings used by find_duplicate_transactions.py to look for transactions with
+# the same description, account and amount that are within a few days of each other
+DUPLICATE_WINDOW_DAYS = 3
+# Set a dollar threshold where it's not worth the work
+DUPLICATE_MIN_AMOUNT = 10.00
+# Ignore possible duplicates in these categories
+DUPLICATE_IGNORED_CATEGORIES = ["Credit Card Payment", "Transfer"]
+# Ignore possible duplicates with any of these Labels, ie: rents that are often
+# the same thing twice
+DUPLICATE_IGNORED_LABELS = []
+# Label transactions with this to mark them as not being duplicates
+DUPLICATE_NOT_DUPLICATE_LABEL = "Not-Duplicate"
+# Transactions can have more than one label.  They are split on commas if
+# there are any (Empower), or on whitespace (LunchMoney).  Uncomment to always
+# split them on the same separator, ie: "," or ";"
+# LABEL_SEPARATOR = ","
+
+# Spending Groups for transactions that move money between your own accounts.
+# Each debit should have a matching credit for the same amount in another
+# account within TRANSFER_TOLERANCE_DAYS.  Transactions without a match are
+# reported by account and year when the spending data is extracted
+TRANSFER_GROUPS = ["Credit Card Payment", "Transfer"]
+TRANSFER_TOLERANCE_DAYS = 3
+
+# Credits in spending groups are treated as refunds.  Each one is matched to
+# the most recent purchase from the same merchant and account within
+# REFUND_MATCH_WINDOW_DAYS before it, preferring a purchase for the same amount.
+# Otherwise the purchase must be at least as large as the refund, less
+# REFUND_MATCH_AMOUNT_TOLERANCE as a fraction of the purchase
+REFUND_MATCH_WINDOW_DAYS = 90
+REFUND_MATCH_AMOUNT_TOLERANCE = 0.0
+
+# Settings used by find_recurring_transactions.py to find subscriptions and other
+# recurring charges from the same merchant and account.  A series needs at least
+# RECURRING_MIN_OCCURRENCES charges, whose amounts vary by no more than
+# RECURRING_MAX_AMOUNT_VARIATION of their average, to be considered recurring
+RECURRING_MIN_OCCURRENCES = 3
+RECURRING_MAX_AMOUNT_VARIATION = 0.25
+
+# show_spending_category_trends.py color codes years whose spending changed by
+# TREND_MINOR_CHANGE_PERCENT to TREND_MAJOR_CHANGE_PERCENT percent, or by more than
+# TREND_MAJOR_CHANGE_PERCENT, from the previous year or the average.  Changes of
+# less than TREND_MIN_CHANGE_DOLLARS are not color coded
+TREND_MINOR_CHANGE_PERCENT = 10
+TREND_MAJOR_CHANGE_PERCENT = 25
+TREND_MIN_CHANGE_DOLLARS = 500
+
 # List of Spending Groups to remove from Projected Retirement Spending
 # List groups as strings, seperated by commas, with no space inbetween
 EXCLUDE_FROM_RETIREMENT = "Kids", "Retirement Saving", "State & Federal Taxes"
 
+# predict_future_spending.py and forecast_spending.py forecast each Spending Group
+# for FORECAST_YEARS years.  Mean, linear trend, exponentially weighted average
+# (EWMA) and inflation adjusted models are backtested on each of the last
+# FORECAST_BACKTEST_YEARS complete years.  Set FORECAST_METHOD to "best" to use
+# the most accurate model for each group, or "blend" to weight all of the models
+# by their accuracy
+FORECAST_YEARS = 5
+FORECAST_METHOD = "blend"
+FORECAST_BACKTEST_YEARS = 3
+# Weight given to the most recent year by the EWMA model
+FORECAST_EWMA_ALPHA = 0.5
+# Annual inflation used by the inflation adjusted model
+FORECAST_INFLATION_RATE = 0.03
+
+# predict_future_spending.py and simulate_retirement_spending.py simulate
+# SIMULATION_PATHS possible paths of SIMULATION_YEARS years of retirement spending.
+# Each simulated year reuses the spending in every group from a random past year,
+# with random inflation, and a SIMULATION_SHOCK_PROBABILITY chance that a group's
+# spending is multiplied by SIMULATION_SHOCK_SIZE that year
+SIMULATION_PATHS = 10000
+SIMULATION_YEARS = 30
+SIMULATION_INFLATION_MEAN = 0.03
+SIMULATION_INFLATION_STDEV = 0.01
+SIMULATION_SHOCK_PROBABILITY = 0.02
+SIMULATION_SHOCK_SIZE = 2.0
+# Paths are simulated in parallel in chunks of this size to limit memory use
+SIMULATION_CHUNK_PATHS = 5000
+SIMULATION_PERCENTILES = [5, 25, 50, 75, 95]
+# Set to a number to get the same results each run
+SIMULATION_SEED = None
+
 #################
 # Output Files
 #################
@@ -119,6 +237,38 @@ OUTPUT_INCOME_DATA = "income.csv"
 # This file is used as input for the visualizations
 OUTPUT_INCOME_BY_SPENDING_BY_GROUP = "group_income.csv"
 
+# Output files of the spending and income by group for each period within the
+# years.  PERIOD_AGGREGATION is one of "month", "quarter", "fiscal year",
+# "rolling 12 months" or "year".  Fiscal years start in FISCAL_YEAR_START_MONTH
+# and are named for the calendar year they end in.  Run aggregate_periods.py to
+# see the extracted data by a different period
+PATH_TO_SPENDING_BY_PERIOD = "group_spending_by_period.csv"
+OUTPUT_INCOME_BY_PERIOD = "group_income_by_period.csv"
+PERIOD_AGGREGATION = "month"
+FISCAL_YEAR_START_MONTH = 1
+
+# Output file of the spending and income totals and number of transactions by
+# month, spending group, category and account.  The reports are generated from
+# it instead of the csv files above.  Run aggregate_cube.py to summarize it
+# by other columns, ie: python aggregate_cube.py --by "Account Name"
+PATH_TO_AGGREGATES = "aggregates.csv.gz"
+
+# Port that query_server.py listens on, on localhost only, and the number of
+# query results it keeps until the transaction data changes
+QUERY_SERVER_PORT = 8765
+QUERY_CACHE_SIZE = 256
+
+# How similar a word must be, from 0 to 1, to match a word in the search of
+# search_transactions.py --fuzzy
+SEARCH_FUZZY_CUTOFF = 0.8
+
+# Uncomment to write the time taken by each stage of a run, ie: read, merge,
+# group, exclude, refund, write and render, to REPORTS_PATH/profile-<script>.json
+# or .csv, and to save a cProfile of one of the stages to REPORTS_PATH/<stage>.prof
+# PROFILE_STAGES = True
+# PROFILE_FORMAT = "json"
+# PROFILE_CPROFILE_STAGE = "merge"
+
 # Directory where visualization files and HTML Reports should be written to
 # If changed make sure that the directory exists
 REPORTS_PATH = "./reports/"
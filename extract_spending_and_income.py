@@ -13,7 +13,9 @@
     from Empower to Mint format
     - If THIRD_PARTY_ACCOUNTS is set, transactions associated from these accounts
     will be extracted and merged with a different transactions file that is
-    prepended with the string specified in the THIRD_PARTY_PREFIX parameter
+    prepended with the string specified in the THIRD_PARTY_PREFIX parameter.
+    ACCOUNT_LEDGERS can route the transactions for other accounts to any
+    number of additional transaction files in the same way
 
     As part of the merging process new transactions are automatically added to
     file specified by PATH_TO_YOUR_TRANSACTIONS.  Possible duplicates are flagged
@@ -22,7 +24,8 @@
     the updated transactions file.
 
     Once the new raw data (if any is detected) is aggregate, the transaction
-    data is processed. Included in this will be adding groups (logical
+    data is processed. Included in this will be converting any amounts in
+    other currencies to BASE_CURRENCY, adding groups (logical
     groupings of transaction categoreis) to each transaction,
     removing groups not relevant to a spending or income analysis,
     and adjusting any credits in spending categories so that they appear as
@@ -37,6 +40,9 @@
     related to spending only
     - OUTPUT_SPENDING_BY_GROUP is a CSV of the total annual spending
     by spending group for each year represented in the transaction data
+
+    The spending and income are also aggregated by month, Spending Group,
+    Category and Account Name in PATH_TO_AGGREGATES for the reports to use
 """
 
 # Import necessary modules
@@ -50,17 +56,27 @@ import os
 import extract_spending_data_methods as esd
 import read_mint_transaction_data as rmtd
 import add_new_transactions as ant
+import match_transfers as mt
+import aggregate_periods as ap
+import aggregate_cube as cube
+import convert_currency as cc
+import profile_stages as ps
 
 # Import shared configuration file
 import expenses_config as ec
 
 
 def extract_data(
-    df, exclude_groups_path, output_data_path, output_by_group_path, is_income
+    df,
+    exclude_groups_path,
+    output_data_path,
+    output_by_group_path,
+    is_income,
+    output_by_period_path=None,
 ):
     """
     Extracts either spending or income data from the given dataframe,
-    and writes the results to disk.
+    writes the results to disk, and returns the extracted data.
 
     Parameters:
     df (pandas.DataFrame): The dataframe containing the raw transaction data.
@@ -72,6 +88,8 @@ def extract_data(
                                 will be written.
     is_income (bool): True if extracting income data,
                       False if extracting spending data.
+    output_by_period_path (str): Optional path to the file where the data
+                                 summarized by PERIOD_AGGREGATION will be written.
     """
     # Set the appropriate function to extract either spending or income data
     if is_income:
@@ -88,50 +106,62 @@ def extract_data(
     saved_stdout = sys.stdout
     sys.stdout = open(report_path, "w")
 
+    # Point out transfers and credit card payments that are missing the
+    # matching transaction in the other account, since these are removed
+    # from the spending data
+    if not is_income:
+        mt.report_unmatched_transfers(df)
+
+        # Find the purchase that each credit is most likely a refund of
+        # across all the years before the data is split up by year
+        df = esd.match_refunds_to_purchases(
+            df,
+            getattr(ec, "REFUND_MATCH_WINDOW_DAYS", 90),
+            getattr(ec, "REFUND_MATCH_AMOUNT_TOLERANCE", 0.0),
+        )
+
     # Iterate through the transaction data a year at a time
-    for year in df.index.year.unique():
-        # Set the date range for the current year
-        from_date = str(year - 1) + "-12-31"
-        to_date = str(year + 1) + "-01-01"
-
-        try:
-            # Extract the appropriate data for the current year
-            year_df = extract_func(df, exclude_groups_path, from_date, to_date)
-        except BaseException as e:
-            print(f"Failed to extract data for year {year}: {e}")
-            sys.exit(-1)
-
-        # Add the extracted data to the running total dataframe
-        column_title = str(year) + " Amount"
-        if all_df.empty:
-            all_df = year_df
-            all_df.rename(columns={"Amount": column_title}, inplace=True)
-        else:
-            year_df.rename(columns={"Amount": column_title}, inplace=True)
-            all_df = pd.concat([year_df, all_df])
-
-    # Write the raw extracted data to disk as a csv
-    all_df.to_csv(output_data_path)
-
-    # Keep only the columns we will summarize
-    all_df.drop(
-        columns=[
-            "Description",
-            "Original Description",
-            "Transaction Type",
-            "Category",
-            "Empower Category",
-            "Account Name",
-            "Labels",
-            "Notes",
-        ],
-        inplace=True,
-        errors="ignore",  # ignore errors in case column does not exist
-    )
+    with ps.stage("exclude", rows_in=len(df)) as s:
+        for year in df.index.year.unique():
+            # Set the date range for the current year
+            from_date = str(year - 1) + "-12-31"
+            to_date = str(year + 1) + "-01-01"
+
+            try:
+                # Extract the appropriate data for the current year
+                year_df = extract_func(df, exclude_groups_path, from_date, to_date)
+            except BaseException as e:
+                print(f"Failed to extract data for year {year}: {e}")
+                sys.exit(-1)
 
-    # Summarize the data by spending group
-    expenses = all_df.groupby(["Spending Group"]).sum()
-    expenses.to_csv(output_by_group_path)
+            # Add the extracted data to the running total dataframe
+            column_title = str(year) + " Amount"
+            if all_df.empty:
+                all_df = year_df
+                all_df.rename(columns={"Amount": column_title}, inplace=True)
+            else:
+                year_df.rename(columns={"Amount": column_title}, inplace=True)
+                all_df = pd.concat([year_df, all_df])
+        s.rows_out = len(all_df)
+
+    output_paths = [output_data_path, output_by_group_path]
+    if output_by_period_path:
+        output_paths.append(output_by_period_path)
+    with ps.stage("write", rows_in=len(all_df), files_written=output_paths):
+        # Write the raw extracted data to disk as a csv
+        all_df.to_csv(output_data_path)
+
+        # Keep only the columns we will summarize
+        summary_df = all_df.filter(regex=r"^(Spending Group|\d{4} Amount)$")
+
+        # Summarize the data by spending group
+        expenses = summary_df.groupby(["Spending Group"]).sum()
+        expenses.to_csv(output_by_group_path)
+
+        # Summarize the data by spending group for periods within each year
+        if output_by_period_path:
+            by_period = ap.aggregate_by_period(ap.get_amounts(summary_df))
+            by_period.to_csv(output_by_period_path)
 
     # Show the report in a webbrowser
     sys.stdout.close()
@@ -143,6 +173,7 @@ def extract_data(
     webbrowser.open(
         "file://" + os.path.realpath(report_path), new=2
     )  # new=2: open in a new tab, if possible
+    return all_df
 
 
 def validate_transactions(df, required_columns):
@@ -192,13 +223,13 @@ def main():
     else:
         # PATH_TO_YOUR_TRANSACTIONS is the only data we have in mint format
         # If configured split out the 3rd party transaction data
-        if hasattr(ec, "THIRD_PARTY_ACCOUNTS") and hasattr(ec, "THIRD_PARTY_PREFIX"):
+        ledgers = rmtd.get_account_ledgers()
+        if len(ledgers):
             df = rmtd.extract_their_accounts_and_get_mine(
                 ec.PATH_TO_YOUR_TRANSACTIONS,
                 "mint",
-                ec.THIRD_PARTY_ACCOUNTS,
                 ec.PATH_TO_YOUR_TRANSACTIONS,
-                ec.THIRD_PARTY_PREFIX,
+                ledgers,
             )
         else:
             df = rmtd.read_mint_transaction_csv(ec.PATH_TO_YOUR_TRANSACTIONS)
@@ -208,6 +239,9 @@ def main():
         print(f"Fix {ec.PATH_TO_YOUR_TRANSACTIONS} and try again.")
         sys.exit(-1)
 
+    # Convert any transactions in other currencies so all of the amounts add up
+    df = cc.convert_to_base_currency(df)
+
     # Run through the transaction list from mint and add a Spending Group column
     # Set the final parameter to True to get some output about which categories
     # are being assigned to which group
@@ -220,23 +254,29 @@ def main():
         sys.exit(-1)
 
     # Extract spending data and generate local CSV files for further processing
-    extract_data(
+    spending_df = extract_data(
         df,
         ec.PATH_TO_GROUPS_TO_EXCLUDE,
         ec.PATH_TO_SPENDING_DATA,
         ec.PATH_TO_SPENDING_BY_GROUP,
         False,
+        getattr(ec, "PATH_TO_SPENDING_BY_PERIOD", None),
     )
 
     # Extract income data  and generate local CSV files for further processing
-    extract_data(
+    income_df = extract_data(
         df,
         ec.PATH_TO_GROUPS_TO_EXCLUDE_FROM_INCOME,
         ec.OUTPUT_INCOME_DATA,
         ec.OUTPUT_INCOME_BY_SPENDING_BY_GROUP,
         True,
+        getattr(ec, "OUTPUT_INCOME_BY_PERIOD", None),
     )
 
+    # Aggregate both once so the reports don't need to read every transaction
+    aggregates = cube.build_cube({"spending": spending_df, "income": income_df})
+    cube.write_cube(aggregates)
+
 
 if __name__ == "__main__":
     main()
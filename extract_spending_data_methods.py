@@ -8,12 +8,25 @@
    (including "income" that was determined to
    be a refund)
 """
+import numpy as np
 import pandas as pd
 import sys
 
+# Import local helper modules
+import recategorization_rules as rr
+import profile_stages as ps
+
 # Avoid SettingWithCopyWarning
 pd.options.mode.chained_assignment = None  # default='warn'
 
+# Columns added to credits in spending groups that identify the purchase
+# that they are most likely a refund of
+REFUND_MATCH_COLUMNS = [
+    "Matched Purchase Date",
+    "Matched Purchase Description",
+    "Matched Purchase Cost",
+]
+
 
 def extract_spending(
     mint_df, exclude_spending_group_list, start_after_date, end_before_date
@@ -237,19 +250,39 @@ def analyze_and_remove_non_income(input_df, spending_group, output_analysis=True
     return input_df
 
 
+@ps.profile_stage("group")
 def group_categories(df, spending_group_defs, show_group_details=False):
     """Add a new "Spending Group" column to group categories
 
     The categories that belong to each spending group are defined
     in a CSV file that is passed in via the spending_group_defs
     """
-    # Create a new "Spending Group" column so that we can start
-    # grouping related expenses into a single bucket
-    df["Spending Group"] = df.Category
-
     print(
         "Reading spending category definitions from spending from", spending_group_defs
     )
+    spending_group_map = read_spending_group_map(
+        spending_group_defs, show_group_details
+    )
+
+    # Create a new "Spending Group" column so that we can start
+    # grouping related expenses into a single bucket.  Categories that
+    # aren't assigned to a group are their own Spending Group
+    df["Spending Group"] = df.Category.map(spending_group_map).fillna(df.Category)
+
+    # Recategorization rules can put transactions in a different Spending Group
+    rule_groups = rr.get_rule_values(df["Description"], "Spending Group")
+    df["Spending Group"] = rule_groups.fillna(df["Spending Group"])
+
+    return df
+
+
+def read_spending_group_map(spending_group_defs, show_group_details=False):
+    """Returns a dict that maps each category to its Spending Group
+
+    The CSV passed in via spending_group_defs has a column per Spending Group
+    with the group name in the first row and its categories listed below it.
+    If a category is listed under multiple groups, the last one wins.
+    """
     try:
         group_cats_df = pd.read_csv(spending_group_defs)
     except BaseException as e:
@@ -261,7 +294,7 @@ def group_categories(df, spending_group_defs, show_group_details=False):
         print("The exception: {}".format(e), file=sys.stderr)
         raise e
 
-    # Iterate over spending groups.
+    spending_group_map = {}
     for group_name, categories in group_cats_df.items():
         categories = categories.dropna()
         if show_group_details:
@@ -271,12 +304,9 @@ def group_categories(df, spending_group_defs, show_group_details=False):
                 + " to: "
                 + str(categories.tolist())
             )
-        # Assign Spending Group to all transactions with categories for that group
-        df.loc[df.Category.isin(categories.tolist()), "Spending Group"] = group_name
-        # print('\nAnalyzing refunds for spending group: '+group_name+'....')
-        # df[grp] = df[grp].apply(find_refunds, axis=1)
+        spending_group_map.update(dict.fromkeys(categories.tolist(), group_name))
 
-    return df
+    return spending_group_map
 
 
 def find_refunds(row):
@@ -296,6 +326,12 @@ def find_refunds(row):
             + row.Description
             + " for ${:,.2f}".format(row.Amount)
         )
+        if pd.notna(row.get("Matched Purchase Date")):
+            print(
+                "    refund of the ${:,.2f}".format(row["Matched Purchase Cost"])
+                + " purchase on "
+                + row["Matched Purchase Date"].strftime("%m/%d/%Y")
+            )
         row.Amount *= -1
         row["Transaction Type"] = "debit"
     return row
@@ -323,6 +359,115 @@ def find_expenses(row):
     return row
 
 
+def normalize_merchant(descriptions):
+    """Returns a series with a normalized merchant name for each description,
+    ie: "STARBUCKS #1234" and "Starbucks 5678" both become "starbucks"
+
+    The Merchant set by a matching recategorization rule is used instead when
+    there is one.  Each unique description is only normalized once
+    """
+    unique_descriptions = pd.Series(descriptions.dropna().unique(), dtype=object)
+    merchants = (
+        rr.get_rule_values(unique_descriptions, "Merchant")
+        .fillna(unique_descriptions)
+        .str.lower()
+        .str.replace(r"[^a-z& ]+", " ", regex=True)
+        .str.split()
+        .str.join(" ")
+    )
+    return descriptions.map(dict(zip(unique_descriptions, merchants))).fillna("")
+
+
+@ps.profile_stage("refund")
+def match_refunds_to_purchases(df, window_days=90, amount_tolerance=0.0):
+    """Adds REFUND_MATCH_COLUMNS to a dataframe of transactions indexed by date,
+    identifying the purchase that each credit is most likely a refund of.
+
+    A credit matches the most recent debit from the same merchant and account
+    within window_days before it.  A debit for the same amount is preferred.
+    Otherwise the most recent debit that is at least as large as the credit,
+    (less amount_tolerance as a fraction of the debit) is used, since refunds
+    can be partial.
+
+    The exact matches for all the credits are found at once with an as-of join
+    on date.  The partial ones are found in rounds of as-of joins, where the
+    credits whose purchase was too small look further back in the next round.
+    Returns a copy of df with the new columns
+    """
+    df = df.copy()
+    transactions = df.reset_index()[["Date", "Description", "Amount"]]
+    transactions["Row"] = range(len(df))
+    transactions["Merchant"] = normalize_merchant(df["Description"]).to_numpy()
+    transactions["Account Name"] = df["Account Name"].to_numpy()
+    transactions = transactions.sort_values("Date")
+    is_credit = (df["Transaction Type"] == "credit").to_numpy()[transactions["Row"]]
+    credits = transactions[is_credit]
+    purchases = transactions[~is_credit].rename(
+        columns={
+            "Date": "Matched Purchase Date",
+            "Description": "Matched Purchase Description",
+            "Row": "Matched Row",
+        }
+    )
+    purchases["Matched Purchase Cost"] = purchases["Amount"]
+    window = pd.Timedelta(days=window_days)
+
+    # Look for a purchase for the same amount first, and then for the
+    # most recent purchase that is large enough to have been partially refunded
+    exact = pd.merge_asof(
+        credits,
+        purchases,
+        left_on="Date",
+        right_on="Matched Purchase Date",
+        by=["Merchant", "Account Name", "Amount"],
+        direction="backward",
+        tolerance=window,
+    ).dropna(subset=["Matched Row"])
+    unmatched = credits[~credits["Row"].isin(exact["Row"])]
+
+    # Number the purchases in date order, and start each credit's search at
+    # the last purchase on or before its date
+    purchases = purchases.sort_values(
+        ["Matched Purchase Date", "Matched Row"], kind="stable"
+    )
+    purchases["Position"] = np.arange(len(purchases))
+    purchases["Matched Position"] = purchases["Position"]
+    pending = unmatched.assign(
+        Position=np.searchsorted(
+            purchases["Matched Purchase Date"].to_numpy(),
+            unmatched["Date"].to_numpy(),
+            side="right",
+        )
+        - 1
+    )
+    matches = [exact]
+    while len(pending) and len(purchases):
+        found = pd.merge_asof(
+            pending.sort_values("Position"),
+            purchases,
+            on="Position",
+            by=["Merchant", "Account Name"],
+            direction="backward",
+            suffixes=("", " Purchase"),
+        ).dropna(subset=["Matched Row"])
+        # Earlier purchases are even further outside of the window
+        found = found[found["Matched Purchase Date"] >= found["Date"] - window]
+        big_enough = found["Amount"] <= found["Matched Purchase Cost"] * (
+            1 + amount_tolerance
+        )
+        matches.append(found[big_enough])
+        # Look for an earlier purchase for the credits whose purchase was too small
+        too_small = found[~big_enough]
+        pending = too_small[unmatched.columns].assign(
+            Position=too_small["Matched Position"].astype(int) - 1
+        )
+    matches = pd.concat(matches).set_index("Row")
+
+    for col in REFUND_MATCH_COLUMNS:
+        df[col] = matches[col].reindex(range(len(df))).to_numpy()
+    return df
+
+
 def extract_transactions_by_date_range(input_df, start_after_date, end_before_date):
     """Helper method to extract all transactions in a date range"""
     print(
@@ -0,0 +1,152 @@
+"""find_duplicate_transactions.py
+
+    Look for possible duplicate transactions in the local csv of transaction
+    data.  This is the command line version of find_duplicate_transactions.ipynb
+
+    Transactions are possible duplicates when they have the same Original
+    Description (or Description if there is no Original Description), Account
+    Name and Amount, and each one is within DUPLICATE_WINDOW_DAYS of the
+    previous one.  Clusters of possible duplicates are ignored when:
+    - the transactions are for less than DUPLICATE_MIN_AMOUNT
+    - all the transactions are in one of the DUPLICATE_IGNORED_CATEGORIES
+    - any of the transactions has one of the DUPLICATE_IGNORED_LABELS
+    - any of the transactions has the DUPLICATE_NOT_DUPLICATE_LABEL
+    The label may be one of several labels on a transaction
+    - there is one credit and one debit, which is probably a refund
+
+    Usage:
+        python find_duplicate_transactions.py [--year YEAR] [--days DAYS]
+            [--min-amount AMOUNT] [--output CSV_FILE]
+"""
+import argparse
+import numpy as np
+
+# Import local helper modules
+import label_matrix as lm
+import read_mint_transaction_data as rmtd
+
+# Import shared configuration file
+import expenses_config as ec
+
+# Transactions with the same values in these columns may be duplicates
+DUPLICATE_KEY_COLUMNS = ["Match Description", "Account Name", "Amount"]
+
+
+def find_duplicate_transactions(
+    df,
+    days=getattr(ec, "DUPLICATE_WINDOW_DAYS", 3),
+    min_amount=getattr(ec, "DUPLICATE_MIN_AMOUNT", 10.00),
+    ignored_categories=getattr(ec, "DUPLICATE_IGNORED_CATEGORIES", []),
+    ignored_labels=getattr(ec, "DUPLICATE_IGNORED_LABELS", []),
+    not_duplicate_label=getattr(ec, "DUPLICATE_NOT_DUPLICATE_LABEL", "Not-Duplicate"),
+):
+    """
+    Returns a dataframe with the possible duplicates found in a dataframe of
+    transactions that is not indexed on date.  A "Duplicate Group" column
+    identifies the transactions that may be duplicates of each other.
+
+    The transactions are sorted once, and then the clusters of possible
+    duplicates and the rules that exclude them are computed for all of the
+    transactions at once
+    """
+    df = df[df["Amount"] >= min_amount].copy()
+    df["Match Description"] = (
+        df["Original Description"].fillna(df["Description"]).fillna("")
+    )
+    df = df.sort_values(DUPLICATE_KEY_COLUMNS + ["Date"], kind="stable")
+
+    # A new cluster starts whenever the key changes or there is a gap of more
+    # than days since the previous transaction with the same key
+    keys = df[DUPLICATE_KEY_COLUMNS].fillna("")
+    same_key = (keys == keys.shift()).all(axis=1).to_numpy()
+    gap_days = df["Date"].diff().dt.days.to_numpy()
+    new_cluster = ~same_key | (gap_days > days)
+    cluster = np.cumsum(new_cluster) - 1
+
+    # Count the transactions in each cluster that match each exclusion rule.
+    # A transaction has a label if it is one of its labels, or all of them
+    size = np.bincount(cluster)
+    labels = df["Labels"].fillna("")
+    label_matrix = lm.build_label_matrix(labels)
+    not_duplicate = (labels == not_duplicate_label).to_numpy() | lm.has_labels(
+        label_matrix, [not_duplicate_label]
+    )
+    num_not_duplicate = np.bincount(cluster, weights=not_duplicate)
+    has_ignored_label = labels.isin(ignored_labels).to_numpy() | lm.has_labels(
+        label_matrix, ignored_labels
+    )
+    num_ignored_labels = np.bincount(cluster, weights=has_ignored_label)
+    num_ignored_categories = np.bincount(
+        cluster, weights=df["Category"].isin(ignored_categories).to_numpy()
+    )
+    num_credits = np.bincount(
+        cluster, weights=(df["Transaction Type"] == "credit").to_numpy()
+    )
+    is_refund_pair = (size == 2) & (num_credits == 1)
+
+    possible_duplicate = (
+        (size > 1)
+        & (num_not_duplicate == 0)
+        & (num_ignored_labels == 0)
+        & (num_ignored_categories < size)
+        & ~is_refund_pair
+    )
+    keep = possible_duplicate[cluster]
+
+    duplicates_df = df[keep].drop(columns="Match Description")
+    group_numbers = np.unique(cluster[keep], return_inverse=True)[1] + 1
+    duplicates_df.insert(0, "Duplicate Group", group_numbers)
+    return duplicates_df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find possible duplicates in "
+        f"{ec.PATH_TO_YOUR_TRANSACTIONS}"
+    )
+    parser.add_argument("--year", type=int, help="only look at this year")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=getattr(ec, "DUPLICATE_WINDOW_DAYS", 3),
+        help="number of days apart that duplicates can be",
+    )
+    parser.add_argument(
+        "--min-amount",
+        type=float,
+        default=getattr(ec, "DUPLICATE_MIN_AMOUNT", 10.00),
+        help="ignore transactions for less than this amount",
+    )
+    parser.add_argument("--output", help="write the possible duplicates to this csv")
+    args = parser.parse_args()
+
+    df = rmtd.read_mint_transaction_csv(
+        ec.PATH_TO_YOUR_TRANSACTIONS, index_on_date=False
+    )
+    if args.year:
+        print(f"Reviewing transactions from the year {args.year}:")
+        df = df[df["Date"].dt.year == args.year]
+    else:
+        print("Reviewing all transactions:")
+    print(
+        "Will print out any possible duplicates where there are multiple "
+        'transactions\nthat have the same value for "Original Description", '
+        f'"Account Name", and "Amount"\nwithin a window of {args.days} days\n'
+    )
+    if args.min_amount > 0:
+        print(f"Transactions less than {args.min_amount:.2f} are ignored\n")
+
+    duplicates_df = find_duplicate_transactions(
+        df, days=args.days, min_amount=args.min_amount
+    )
+    num_groups = duplicates_df["Duplicate Group"].nunique()
+    print(f"Found {num_groups} groups of possible duplicates")
+    if num_groups:
+        print(duplicates_df.to_string(index=False))
+    if args.output:
+        print(f"Writing the possible duplicates to {args.output}")
+        duplicates_df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
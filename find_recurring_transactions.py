@@ -0,0 +1,183 @@
+"""find_recurring_transactions.py
+
+    Look for recurring charges, like subscriptions, memberships and bills, in
+    the local csv of transaction data.
+
+    Debits are grouped into series by normalized merchant and account.  Each
+    series with at least RECURRING_MIN_OCCURRENCES charges is classified as
+    weekly, monthly or annual based on the median number of days between its
+    charges, or as irregular if the median interval doesn't fall in one of the
+    RECURRING_FREQUENCIES ranges or the amounts vary by more than
+    RECURRING_MAX_AMOUNT_VARIATION of their average.
+
+    A recurring series is still active if its most recent charge is no more
+    than one and a half intervals before the last transaction in the ledger.
+    The active subscriptions are reported with their annualized cost, ie: the
+    most recent charge times the number of charges per year, by Spending Group.
+
+    Usage:
+        python find_recurring_transactions.py [--all] [--output CSV_FILE]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+# Import local helper modules
+import extract_spending_data_methods as esd
+import read_mint_transaction_data as rmtd
+
+# Import shared configuration file
+import expenses_config as ec
+
+# Range of median days between charges, and the number of charges per year,
+# for each frequency of recurring charge
+RECURRING_FREQUENCIES = {
+    "weekly": (5, 9, 52),
+    "monthly": (26, 35, 12),
+    "annual": (350, 380, 1),
+}
+RECURRING_MIN_OCCURRENCES = getattr(ec, "RECURRING_MIN_OCCURRENCES", 3)
+RECURRING_MAX_AMOUNT_VARIATION = getattr(ec, "RECURRING_MAX_AMOUNT_VARIATION", 0.25)
+TRANSFER_GROUPS = getattr(ec, "TRANSFER_GROUPS", ["Credit Card Payment", "Transfer"])
+
+
+def find_recurring_series(
+    df,
+    min_occurrences=RECURRING_MIN_OCCURRENCES,
+    max_amount_variation=RECURRING_MAX_AMOUNT_VARIATION,
+    ignored_groups=TRANSFER_GROUPS,
+):
+    """
+    Returns a dataframe with a row for each series of debits from the same
+    merchant and account in a dataframe of transactions that is not indexed on
+    date, with its frequency, amounts and annualized cost.
+
+    The transactions are sorted once, and the intervals between charges and
+    the statistics for every series are computed for all of them at once
+    """
+    debits = df[
+        (df["Transaction Type"] == "debit") & ~df["Spending Group"].isin(ignored_groups)
+    ].copy()
+    debits["Merchant"] = esd.normalize_merchant(debits["Description"])
+    debits = debits[debits["Merchant"] != ""].sort_values(
+        ["Merchant", "Account Name", "Date"], kind="stable"
+    )
+
+    # Number each series, and the interval from the previous charge in it
+    keys = debits[["Merchant", "Account Name"]].fillna("")
+    new_series = ~(keys == keys.shift()).all(axis=1).to_numpy()
+    series = np.cumsum(new_series) - 1
+    days = debits["Date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    intervals = np.diff(days, prepend=days[:1]).astype(float)
+    intervals[new_series] = np.nan
+
+    amounts = debits["Amount"].to_numpy(dtype=float)
+    count = np.bincount(series)
+    mean_amount = np.bincount(series, weights=amounts) / count
+    variance = np.bincount(series, weights=(amounts - mean_amount[series]) ** 2) / count
+    first = np.flatnonzero(new_series)
+    last = np.r_[first[1:], len(series)][: len(first)] - 1
+
+    summary = pd.DataFrame(
+        {
+            "Merchant": debits["Merchant"].to_numpy()[last],
+            "Account Name": debits["Account Name"].to_numpy()[last],
+            "Spending Group": debits["Spending Group"].to_numpy()[last],
+            "Description": debits["Description"].to_numpy()[last],
+            "Charges": count,
+            "First Date": debits["Date"].to_numpy()[first],
+            "Last Date": debits["Date"].to_numpy()[last],
+            "Median Days Apart": pd.Series(intervals).groupby(series).median(),
+            "Average Amount": mean_amount,
+            "Amount Variation": np.sqrt(variance) / mean_amount,
+            "Last Amount": amounts[last],
+        }
+    )
+    summary = summary[summary["Charges"] >= min_occurrences].reset_index(drop=True)
+
+    # Classify each series, and find when its next charge is expected
+    median = summary["Median Days Apart"].to_numpy()
+    regular = (summary["Amount Variation"] <= max_amount_variation).to_numpy()
+    frequency = np.full(len(summary), "irregular", dtype=object)
+    per_year = np.zeros(len(summary))
+    for name, (min_days, max_days, charges_per_year) in RECURRING_FREQUENCIES.items():
+        in_range = regular & (median >= min_days) & (median <= max_days)
+        frequency[in_range] = name
+        per_year[in_range] = charges_per_year
+    summary["Frequency"] = frequency
+    summary["Annualized Cost"] = summary["Last Amount"] * per_year
+
+    as_of = df["Date"].max()
+    overdue = pd.to_timedelta(np.nan_to_num(median) * 1.5, unit="D")
+    summary["Active"] = (summary["Frequency"] != "irregular") & (
+        summary["Last Date"] + overdue >= as_of
+    )
+    return summary
+
+
+def summarize_subscriptions(recurring):
+    """
+    Returns the number and annualized cost of the active subscriptions in
+    each Spending Group, most expensive first
+    """
+    active = recurring[recurring["Active"]]
+    summary = active.groupby("Spending Group")["Annualized Cost"].agg(
+        ["count", "sum"]
+    )
+    summary.columns = ["Subscriptions", "Annualized Cost"]
+    summary = summary.sort_values("Annualized Cost", ascending=False)
+    summary.loc["Total"] = summary.sum()
+    summary["Subscriptions"] = summary["Subscriptions"].astype(int)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Find recurring charges in {ec.PATH_TO_YOUR_TRANSACTIONS}"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="list irregular and inactive series as well as active subscriptions",
+    )
+    parser.add_argument("--output", help="write the recurring charges to this csv")
+    args = parser.parse_args()
+
+    df = rmtd.read_mint_transaction_csv(ec.PATH_TO_YOUR_TRANSACTIONS)
+    df = esd.group_categories(df, ec.PATH_TO_SPENDING_GROUPS).reset_index()
+    recurring = find_recurring_series(df)
+    if not args.all:
+        recurring = recurring[recurring["Active"]]
+    recurring = recurring.sort_values(
+        ["Spending Group", "Annualized Cost"], ascending=[True, False]
+    )
+
+    print(
+        f"\nFound {recurring['Active'].sum()} active subscriptions as of "
+        f"{df['Date'].max():%Y-%m-%d}:"
+    )
+    columns = [
+        "Spending Group",
+        "Description",
+        "Account Name",
+        "Frequency",
+        "Charges",
+        "Last Date",
+        "Last Amount",
+        "Annualized Cost",
+    ]
+    if not recurring.empty:
+        print(recurring[columns].to_string(index=False, float_format="{:,.2f}".format))
+        print("\n------ Annualized Cost of Active Subscriptions ---------")
+        print(
+            summarize_subscriptions(recurring).to_string(
+                float_format="${:,.2f}".format
+            )
+        )
+    if args.output:
+        print(f"Writing the recurring charges to {args.output}")
+        recurring.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""forecast_spending.py
+
+    Forecast the spending in each Spending Group for the next few years from
+    the annual spending by group in PATH_TO_AGGREGATES.
+
+    Several models are fit to the history of every group at once:
+    - Mean: the average of the previous years
+    - Trend: a straight line fit through the previous years
+    - EWMA: an exponentially weighted average that favors recent years
+    - Inflation Adjusted: the average of the previous years in today's dollars,
+      grown by FORECAST_INFLATION_RATE each year
+
+    Each model is backtested by forecasting each of the last
+    FORECAST_BACKTEST_YEARS years from the years before it.  For each group
+    either the model with the smallest average error is used ("best"), or all
+    of the models are blended, weighted by the inverse of their error ("blend").
+
+    Usage:
+        python forecast_spending.py [--years N] [--method best|blend]
+"""
+import argparse
+import re
+import sys
+import numpy as np
+import pandas as pd
+
+# Import local helper modules
+import aggregate_cube as cube
+
+# Import the shared configuration file
+import expenses_config as ec
+
+FORECAST_YEARS = getattr(ec, "FORECAST_YEARS", 5)
+FORECAST_METHOD = getattr(ec, "FORECAST_METHOD", "blend")
+FORECAST_BACKTEST_YEARS = getattr(ec, "FORECAST_BACKTEST_YEARS", 3)
+FORECAST_EWMA_ALPHA = getattr(ec, "FORECAST_EWMA_ALPHA", 0.5)
+FORECAST_INFLATION_RATE = getattr(ec, "FORECAST_INFLATION_RATE", 0.03)
+
+
+def get_year_columns(df):
+    """Returns the "YYYY Amount" columns of df, and their years, in year order"""
+    columns = [col for col in df.columns if re.match(r"^\d{4} Amount$", col)]
+    years = np.array([int(col.split(" ", 1)[0]) for col in columns])
+    order = np.argsort(years)
+    return [columns[i] for i in order], years[order]
+
+
+def forecast_mean(history, years, future_years):
+    """Forecasts the average of the previous years"""
+    return np.repeat(history.mean(axis=1, keepdims=True), len(future_years), axis=1)
+
+
+def forecast_trend(history, years, future_years):
+    """Forecasts along a least squares line through the previous years.
+    Groups that have never had negative spending are not forecast below zero
+    """
+    x = years - years.mean()
+    y_mean = history.mean(axis=1, keepdims=True)
+    variance = (x**2).sum()
+    slope = ((history - y_mean) @ x / variance)[:, np.newaxis] if variance else 0
+    forecast = y_mean + slope * (future_years - years.mean())
+    never_negative = history.min(axis=1, keepdims=True) >= 0
+    return np.where(never_negative, np.maximum(forecast, 0), forecast)
+
+
+def forecast_ewma(history, years, future_years, alpha=FORECAST_EWMA_ALPHA):
+    """Forecasts an exponentially weighted average of the previous years"""
+    weights = (1 - alpha) ** (years.max() - years)
+    level = history @ weights / weights.sum()
+    return np.repeat(level[:, np.newaxis], len(future_years), axis=1)
+
+
+def forecast_inflation_adjusted(
+    history, years, future_years, inflation=FORECAST_INFLATION_RATE
+):
+    """Forecasts the average of the previous years in the last year's dollars,
+    grown by inflation each year after that
+    """
+    real = history * (1 + inflation) ** (years.max() - years)
+    growth = (1 + inflation) ** (future_years - years.max())
+    return real.mean(axis=1, keepdims=True) * growth
+
+
+FORECAST_MODELS = {
+    "Mean": forecast_mean,
+    "Trend": forecast_trend,
+    "EWMA": forecast_ewma,
+    "Inflation Adjusted": forecast_inflation_adjusted,
+}
+
+
+def backtest_models(history, years, backtest_years=FORECAST_BACKTEST_YEARS):
+    """Returns a (models x groups) array with the average absolute error of
+    each model when forecasting each of the last backtest_years years from
+    the years before it.  Models are only backtested with at least two years
+    of history, and the errors are NaN if there aren't enough years
+    """
+    backtest_years = min(backtest_years, len(years) - 2)
+    errors = np.full((len(FORECAST_MODELS), len(history)), np.nan)
+    if backtest_years < 1:
+        return errors
+    errors[:] = 0
+    for held_out in range(len(years) - backtest_years, len(years)):
+        train, train_years = history[:, :held_out], years[:held_out]
+        for i, model in enumerate(FORECAST_MODELS.values()):
+            forecast = model(train, train_years, years[held_out : held_out + 1])
+            errors[i] += np.abs(forecast[:, 0] - history[:, held_out])
+    return errors / backtest_years
+
+
+def get_model_weights(errors, method=FORECAST_METHOD):
+    """Returns a (models x groups) array of the weight given to each model
+
+    method - "best" to use the model with the smallest error for each group,
+             or "blend" to weight every model by the inverse of its error
+    """
+    if np.isnan(errors).all():
+        # Without a backtest fall back to the average of the previous years
+        weights = np.zeros_like(errors)
+        weights[list(FORECAST_MODELS).index("Mean")] = 1
+        return weights
+    if method == "best":
+        weights = np.zeros_like(errors)
+        weights[errors.argmin(axis=0), np.arange(errors.shape[1])] = 1
+        return weights
+    if method != "blend":
+        raise ValueError(f'Unknown forecast method "{method}", use best or blend')
+    # A model with no error for a group gets all of the weight
+    with np.errstate(divide="ignore"):
+        inverse = 1 / errors
+    perfect = np.isinf(inverse)
+    inverse[:, perfect.any(axis=0)] = perfect[:, perfect.any(axis=0)]
+    return inverse / inverse.sum(axis=0)
+
+
+def forecast_spending(
+    df,
+    num_years=FORECAST_YEARS,
+    method=FORECAST_METHOD,
+    backtest_years=FORECAST_BACKTEST_YEARS,
+):
+    """Returns the forecast spending for each group in df for the num_years
+    after the last year in df, and the weight given to each model for each group
+
+    df - a dataframe indexed by Spending Group with "YYYY Amount" columns.
+         Years without spending in a group are treated as zero
+    """
+    columns, years = get_year_columns(df)
+    history = df[columns].fillna(0).to_numpy(dtype=float)
+    future_years = years.max() + np.arange(1, num_years + 1)
+
+    weights = get_model_weights(backtest_models(history, years, backtest_years), method)
+    forecasts = np.stack(
+        [model(history, years, future_years) for model in FORECAST_MODELS.values()]
+    )
+    forecast = (forecasts * weights[:, :, np.newaxis]).sum(axis=0)
+
+    forecast_df = pd.DataFrame(
+        forecast,
+        index=df.index,
+        columns=[f"{year} Forecast" for year in future_years],
+    )
+    weights_df = pd.DataFrame(weights.T, index=df.index, columns=list(FORECAST_MODELS))
+    return forecast_df, weights_df
+
+
+def complete_year(year):
+    """Returns True for each year with complete data that can be used to forecast"""
+    return (year >= ec.IGNORE_YEARS_BEFORE) & (year != ec.CURRENT_YEAR)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Forecast spending by group from {cube.PATH_TO_AGGREGATES}"
+    )
+    parser.add_argument(
+        "--years", type=int, default=FORECAST_YEARS, help="number of years to forecast"
+    )
+    parser.add_argument(
+        "--method",
+        choices=["best", "blend"],
+        default=FORECAST_METHOD,
+        help="use the best model for each group, or blend them",
+    )
+    args = parser.parse_args()
+
+    df = cube.get_annual_totals(cube.read_cube(), "spending")
+    columns, years = get_year_columns(df)
+    df = df[np.array(columns)[complete_year(years)]]
+    if df.columns.empty:
+        print(
+            "There isn't a complete year of spending to forecast from.  Check "
+            "IGNORE_YEARS_BEFORE and CURRENT_YEAR in expenses_config.py"
+        )
+        sys.exit(-1)
+    forecast_df, weights_df = forecast_spending(df, args.years, args.method)
+    forecast_df.loc["Total"] = forecast_df.sum()
+    print(forecast_df.to_string(float_format="${:,.2f}".format))
+    print("\n------ Weight of each model by Spending Group ---------")
+    print(weights_df.to_string(float_format="{:.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,17 @@
     Loading these CSV files into a spreadsheet and comparing them can be useful
     to identify why spending changed and to identify changes in spending habits
     or possibly miscategorized transactions.
+
+    Usage:
+        python get_category_transactions.py [GROUP] [YEARS]
+        python get_category_transactions.py --groups GROUP ... --years YEARS
+        python get_category_transactions.py --all-groups --years YEARS
+    ie: python get_category_transactions.py Travel 2020-2022
+    Any number of groups are exported in one run, which reads the spending
+    transactions and indexes them by spending group and year only once
 """
 
+import argparse
 import pandas as pd
 import re
 import sys
@@ -21,6 +30,8 @@ import sys
 # Import shared configuration file
 import expenses_config as ec
 import visualization_methods as vms
+import aggregate_cube as cube
+import aggregate_periods as ap
 
 # List of columns that we want to keep in addition to Date and Amount
 COLUMNS_OF_INTEREST = ["Description", "Category"]
@@ -50,102 +61,131 @@ def sanitize_filename(s):
     return s
 
 
-def output_raw_transactions(group_df, df, group, cols_to_keep, years, outfile):
-    # Remove indices of dataframes before merging
-    group_df.reset_index(inplace=True)
+def build_transaction_index(df):
+    """Returns a dict mapping each (Spending Group, year) to the positions of
+    its transactions in df, so any group and year can be looked up directly
 
-    # Get the list of "XXXX Amount column names we are interested in"
-    column_names = [f"{year} Amount" for year in years]
+    df - the extracted spending transactions indexed by Date
+    """
+    return df.groupby([df["Spending Group"], df.index.year]).indices
+
+
+def parse_years(years_str):
+    """Returns the list of years in a string like 2020-2022 or 2022"""
+    if "-" in years_str:
+        start_year, end_year = map(int, years_str.split("-"))
+        return list(range(start_year, end_year + 1))
+    return [int(years_str)]
 
-    # Determine the year with the most transactions to create a spacer column
-    max_trans = df[column_names].count().max()
-    spacer = pd.DataFrame({"": [""] * max_trans})
-    group_df = pd.concat([group_df, spacer], axis=1)
 
+def output_raw_transactions(group_df, df, index, group, cols_to_keep, years, outfile):
+    """Writes the summary of spending by category next to the transactions for
+    each year, separated by blank columns, to a csv
+
+    df - the extracted spending transactions with an Amount column
+    index - the (Spending Group, year) index built by build_transaction_index
+    """
     # Build a dataframe of the raw transactions for each each year
-    for i, col in enumerate(column_names):
-        year = years[i]
-        year_df = df[df[col].notna()]
+    year_dfs = []
+    for year in years:
+        year_df = df.iloc[index.get((group, year), [])]
         print(
             f"\nThere were {len(year_df)} transactions for "
-            f"Total spending on {group} for {year}: {year_df[col].sum():.2f}"
+            f"Total spending on {group} for {year}: {year_df['Amount'].sum():.2f}"
         )
-        year_df = year_df[cols_to_keep + [col]]
+        year_df = year_df[cols_to_keep + ["Amount"]]
         year_df = year_df.rename(
             columns={
                 "Description": f"{year} Description",
                 "Category": f"{year} Category",
+                "Amount": f"{year} Amount",
             }
         ).sort_index()
         year_df.rename_axis(f"{year} Date", inplace=True)
-        year_df.reset_index(inplace=True)
-        group_df = pd.concat([group_df, year_df, spacer], axis=1)
+        year_dfs.append(year_df.reset_index())
+
+    # Put a spacer column after the summary and each year, as long as the year
+    # with the most transactions, and assemble them all at once
+    max_trans = max(len(year_df) for year_df in year_dfs)
+    spacer = pd.DataFrame({"": [""] * max_trans})
+    blocks = [group_df.reset_index(), spacer]
+    for year_df in year_dfs:
+        blocks += [year_df, spacer]
 
     print(f"\nWriting this summary of spending by category to {outfile}")
-    group_df.to_csv(outfile, index=False)
+    pd.concat(blocks, axis=1).to_csv(outfile, index=False)
 
 
 def main():
-    # Read in command-line arguments or prompt for spending group and years
+    parser = argparse.ArgumentParser(
+        description="Write the spending by category and the transactions in "
+        "spending groups for a range of years to csv files"
+    )
+    parser.add_argument("group", nargs="?", help="the spending group")
+    parser.add_argument("years", nargs="?", help="ie: 2020-2022 or 2022")
+    parser.add_argument(
+        "--groups", nargs="+", default=[], help="more spending groups to export"
+    )
+    parser.add_argument(
+        "--all-groups", action="store_true", help="export every spending group"
+    )
+    parser.add_argument("--years", dest="years_option", help="ie: 2020-2022")
+    args = parser.parse_args()
+
+    # Prompt for the spending group and years if they weren't given
+    groups = ([args.group] if args.group else []) + args.groups
+    years_str = args.years or args.years_option
     try:
-        if len(sys.argv) >= 2:
-            args = sys.argv[1:]
-            spending_group = args.pop(0)
-            years_str = args.pop(0)
-        else:
-            spending_group = input("Enter the spending group: ")
+        if not groups and not args.all_groups:
+            groups = [input("Enter the spending group: ")]
+        if years_str is None:
             years_str = input(
                 "Enter the years to examine seperated by hyphens (ie:2020-2022): "
             )
-
-        # convert the string of years into a hyphenated list
-        years_str_list = years_str.split("-")
-        years = [int(year.strip()) for year in years_str_list]
-
-        if "-" in years_str:
-            # convert the string of years into a hyphenated list
-            start_year, end_year = map(int, years_str.split("-"))
-            years = [str(year) for year in range(start_year, end_year + 1)]
-        else:
-            years = [int(years_str)]
-
+        years = parse_years(years_str)
     except ValueError:
         print("Invalid input. Please enter the spending group and years.")
         print("Alternately if you supply no params you will be prompted.")
         sys.exit(1)
 
-    # Create a dataframe from the csv with all the spending transactions
+    # Create a dataframe from the csv with all the spending transactions, and
+    # index it by spending group and year once for all of the exports
     all_df = vms.read_structured_transactions(
         ec.PATH_TO_SPENDING_DATA,
         ec.PATH_TO_YOUR_TRANSACTIONS,
         "Date",
         "spending transaction data",
     )
-
-    # Extract just the transactions for the spending group and years in question
-    df = all_df[(all_df["Spending Group"] == spending_group)]
-    conditions = [df[f"{year} Amount"].notna() for year in years]
-    # Combine the conditions with the logical OR operator
-    years_condition = conditions[0]
-    for condition in conditions[1:]:
-        years_condition |= condition
-    df = df[years_condition]
-
-    # Drop the empy amount columns for the other years
-    df = df.dropna(axis=1, how="all")
-
-    # Build a summary of spending by category for each of the years
-    group_df = vms.build_category_details(df)
-    print(group_df)
-    outfile = f"{sanitize_filename(spending_group)}-by-category-{years_str}.csv"
-    # print(f"\nWriting this summary of spending by category to {outfile}")
-    # group_df.to_csv(outfile)
-
-    # Write all the raw transactions to another csv
-    outfile = f"{sanitize_filename(spending_group)}-transactions-{years_str}.csv"
-    output_raw_transactions(
-        group_df, df, spending_group, COLUMNS_OF_INTEREST, years, outfile
+    all_df.index = pd.to_datetime(all_df.index)
+    all_df = ap.get_amounts(all_df)
+    index = build_transaction_index(all_df)
+    if args.all_groups:
+        groups = sorted(set(groups) | set(all_df["Spending Group"].dropna()))
+
+    # Build a summary of spending by category for each of the groups and years
+    # from the aggregated transactions
+    summary = cube.get_annual_totals(
+        cube.read_cube(),
+        "spending",
+        ["Spending Group", "Category"],
+        {"Spending Group": groups, "Year": years},
     )
+    columns = [f"{year} Amount" for year in years]
+    summary = summary.reindex(columns=columns, fill_value=0)
+
+    for spending_group in groups:
+        if not any((spending_group, year) in index for year in years):
+            print(f"\nNo {spending_group} transactions found for {years_str}")
+            continue
+        group_df = summary.xs(spending_group, level="Spending Group").copy()
+        group_df.loc["Total"] = group_df.sum()
+        print(group_df)
+
+        # Write all the raw transactions to another csv
+        outfile = f"{sanitize_filename(spending_group)}-transactions-{years_str}.csv"
+        output_raw_transactions(
+            group_df, all_df, index, spending_group, COLUMNS_OF_INTEREST, years, outfile
+        )
 
 
 if __name__ == "__main__":
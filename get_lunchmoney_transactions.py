@@ -1,17 +1,18 @@
 import pandas as pd
 from datetime import datetime, timedelta
 import sys
-from transactions import read_or_fetch_lm_transactions
+from transactions import read_lm_transactions_csv, read_or_fetch_lm_transactions
 from expenses_config import (
     LOOKBACK_TRANSACTION_DAYS,
     LM_FETCHED_TRANSACTIONS_CACHE,
 )
 
 
-def get_latest_good_lm_transactions(existing_df):
+def get_latest_good_lm_transactions(most_recent_date):
     """
     Fetches all transactions from lunchmoney that are newer than
-    LOOKBACK_TRANSACTION_DAYS from the most recent transaction in MINT_CSV_FILE
+    LOOKBACK_TRANSACTION_DAYS before most_recent_date, the date of the most
+    recent transaction in MINT_CSV_FILE
 
     If there are transactions that have not yet been classified in LunchMoney, exit
     and tell user to finish classifying.
@@ -21,7 +22,7 @@ def get_latest_good_lm_transactions(existing_df):
     to MINT_CSV_FILE in OUPUT_FILES
     """
     new_transactions_df = get_new_lunchmoney_transactions(
-        existing_df, LOOKBACK_TRANSACTION_DAYS
+        most_recent_date, LOOKBACK_TRANSACTION_DAYS
     )
 
     # Exit if there are any transactions that still need to be cleared or categorized
@@ -30,6 +31,17 @@ def get_latest_good_lm_transactions(existing_df):
     return lunchmoney_to_mint_format(new_transactions_df)
 
 
+def read_cached_lm_transactions(csv_file):
+    """
+    Returns the transactions in a local cache of transactions fetched from
+    lunchmoney, ie: LM_FETCHED_TRANSACTIONS_CACHE, converted to mint format
+    """
+    new_transactions_df = read_lm_transactions_csv(csv_file)
+    new_transactions_df = remove_unready_transactions(new_transactions_df)
+    exit_if_transactions_not_ready(new_transactions_df)
+    return lunchmoney_to_mint_format(new_transactions_df)
+
+
 def normalize_empty_values(values_list):
     # Replace NaN, None, and empty lists with an empty string
     empty = ""
@@ -55,12 +67,11 @@ def validate_splits(df):
     return df[~df["has_children"]]
 
 
-def get_new_lunchmoney_transactions(existing_df, lookback_days):
+def get_new_lunchmoney_transactions(most_recent_date, lookback_days):
     """
     Fetches new transactions from LunchMoney for the specified date range.
     """
     # Calculate the start date as 7 days before the most recent transaction date
-    most_recent_date = existing_df["Date"].max()
     start_date = most_recent_date - timedelta(days=lookback_days)
     end_date = datetime.now().date()  # Set the end date to today
 
@@ -73,6 +84,14 @@ def get_new_lunchmoney_transactions(existing_df, lookback_days):
     )
     print(f"Fetched {len(new_transactions_df)} new transactions from LunchMoney.")
 
+    return remove_unready_transactions(new_transactions_df)
+
+
+def remove_unready_transactions(new_transactions_df):
+    """
+    Removes pending transactions and the parents of split transactions
+    from a dataframe of transactions fetched from LunchMoney
+    """
     # For some reason there is often a space before the account name
     # Clean this up until I can figure out why it's happening
     new_transactions_df["account_display_name"] = new_transactions_df[
@@ -147,5 +166,8 @@ def lunchmoney_to_mint_format(to_add_df):
     to_add_mint_format["Labels"] = to_add_mint_format["Labels"].apply(
         lambda x: " ".join([tag["name"] for tag in x]) if x else ""
     )
+    # Keep the currency so amounts in other currencies can be converted later
+    if "currency" in to_add_df.columns:
+        to_add_mint_format["Currency"] = to_add_df["currency"].str.upper()
 
     return to_add_mint_format
@@ -0,0 +1,178 @@
+"""label_matrix.py
+
+    Analyze the Labels of the transactions, ie: the spending with each label,
+    which labels are used together, and the transactions with some labels.
+
+    A transaction can have more than one label.  LunchMoney tags are joined
+    with spaces, and Empower tags with commas, so the Labels of a transaction
+    are split on commas if there are any, or on whitespace otherwise.  Set
+    LABEL_SEPARATOR to always split on the same separator instead.
+
+    The labels are parsed once into a sparse transactions x labels matrix,
+    kept in the compressed sparse row layout: the label numbers of all the
+    transactions, one after another, and the position in them where each
+    transaction's labels start.  Totals, co-occurrence and filters are then
+    array operations on the label numbers instead of string comparisons.
+
+    Usage:
+        python label_matrix.py [--income] [--labels LABEL ...] [--all]
+            [--cooccurrence]
+    Shows the spending in the extracted transactions with each label by year
+"""
+import argparse
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Import the shared configuration file
+import expenses_config as ec
+
+LABEL_SEPARATOR = getattr(ec, "LABEL_SEPARATOR", None)
+
+# indptr - the position in indices where the labels of each transaction start,
+#          with an extra entry at the end for the total number of labels
+# indices - the number of each label in vocabulary, for each transaction
+# vocabulary - the names of the labels in sorted order
+LabelMatrix = namedtuple("LabelMatrix", ["indptr", "indices", "vocabulary"])
+
+
+def split_labels(labels, separator=LABEL_SEPARATOR):
+    """Returns the list of labels in a Labels string
+
+    separator - the separator between labels, or None to split on commas if
+                there are any, or on whitespace otherwise
+    """
+    if not isinstance(labels, str):
+        return []
+    if separator is None:
+        separator = "," if "," in labels else None
+    return [label.strip() for label in labels.split(separator) if label.strip()]
+
+
+def build_label_matrix(labels, separator=LABEL_SEPARATOR):
+    """Returns a LabelMatrix for a series with the Labels of each transaction.
+    Each distinct Labels string is only split once
+    """
+    codes, uniques = pd.factorize(labels, use_na_sentinel=True)
+    split = [sorted(set(split_labels(value, separator))) for value in uniques]
+    # The extra empty list at the end is picked up by the -1 for missing labels
+    split.append([])
+    lengths = np.array([len(value) for value in split], dtype=np.int64)[codes]
+    vocabulary, unique_indices = np.unique(
+        np.array([label for value in split for label in value], dtype=object),
+        return_inverse=True,
+    )
+
+    # Look up each transaction's labels in the flattened labels of the uniques
+    starts = np.concatenate([[0], np.cumsum([len(value) for value in split])])
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    offsets = np.arange(indptr[-1]) - np.repeat(indptr[:-1], lengths)
+    positions = np.repeat(starts[codes], lengths) + offsets
+    return LabelMatrix(indptr, unique_indices[positions], vocabulary.astype(str))
+
+
+def get_label_rows(matrix):
+    """Returns the transaction (row) of each entry in matrix.indices"""
+    return np.repeat(np.arange(len(matrix.indptr) - 1), np.diff(matrix.indptr))
+
+
+def get_label_numbers(matrix, labels):
+    """Returns the numbers of the labels that are in the vocabulary"""
+    positions = np.searchsorted(matrix.vocabulary, labels)
+    positions = np.minimum(positions, max(len(matrix.vocabulary) - 1, 0))
+    found = matrix.vocabulary[positions] == np.asarray(labels, dtype=str)
+    return positions[found]
+
+
+def has_labels(matrix, labels, require_all=False):
+    """Returns a boolean array that is True for the transactions with any of
+    the labels, or with all of them if require_all is True
+    """
+    num_rows = len(matrix.indptr) - 1
+    if not len(matrix.vocabulary) or not len(labels):
+        return np.zeros(num_rows, dtype=bool)
+    numbers = get_label_numbers(matrix, list(labels))
+    hits = np.bincount(
+        get_label_rows(matrix),
+        weights=np.isin(matrix.indices, numbers),
+        minlength=num_rows,
+    )
+    return hits >= len(set(labels)) if require_all else hits > 0
+
+
+def get_label_totals(matrix, amounts):
+    """Returns a dataframe with the total of the amounts for each label
+
+    amounts - a series, or a dataframe with a column for each total, ie: a
+              "YYYY Amount" column for each year, with a row per transaction
+    """
+    amounts = amounts.to_frame() if isinstance(amounts, pd.Series) else amounts
+    values = amounts.fillna(0).to_numpy(dtype=float)
+    totals = np.zeros((len(matrix.vocabulary), values.shape[1]))
+    np.add.at(totals, matrix.indices, values[get_label_rows(matrix)])
+    totals = pd.DataFrame(totals, index=matrix.vocabulary, columns=amounts.columns)
+    totals.index.name = "Label"
+    return totals
+
+
+def get_label_counts(matrix):
+    """Returns a series with the number of transactions with each label"""
+    counts = np.bincount(matrix.indices, minlength=len(matrix.vocabulary))
+    return pd.Series(counts, index=pd.Index(matrix.vocabulary, name="Label"))
+
+
+def get_cooccurrence(matrix):
+    """Returns a labels x labels dataframe with the number of transactions
+    that have both labels.  The diagonal is the number with each label
+    """
+    size = len(matrix.vocabulary)
+    entries = pd.DataFrame({"Row": get_label_rows(matrix), "Label": matrix.indices})
+    pairs = entries.merge(entries, on="Row")
+    counts = np.bincount(
+        pairs["Label_x"].to_numpy() * size + pairs["Label_y"].to_numpy(),
+        minlength=size * size,
+    ).reshape(size, size)
+    return pd.DataFrame(counts, index=matrix.vocabulary, columns=matrix.vocabulary)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show the spending or income with each label by year"
+    )
+    parser.add_argument(
+        "--income", action="store_true", help="show income instead of spending"
+    )
+    parser.add_argument(
+        "--labels", nargs="+", default=[], help="only transactions with these labels"
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="only transactions with all the labels"
+    )
+    parser.add_argument(
+        "--cooccurrence",
+        action="store_true",
+        help="show the number of transactions with each pair of labels",
+    )
+    args = parser.parse_args()
+
+    path = ec.OUTPUT_INCOME_DATA if args.income else ec.PATH_TO_SPENDING_DATA
+    print(f"Reading extracted transactions from {path}")
+    df = pd.read_csv(path, index_col="Date", parse_dates=["Date"])
+    matrix = build_label_matrix(df["Labels"])
+    if args.labels:
+        rows = has_labels(matrix, args.labels, args.all)
+        print(f"{rows.sum()} of {len(df)} transactions have the labels")
+        df = df[rows]
+        matrix = build_label_matrix(df["Labels"])
+
+    amounts = df.filter(regex=r"^\d{4} Amount$")
+    totals = get_label_totals(matrix, amounts[sorted(amounts.columns)])
+    totals.insert(0, "Transactions", get_label_counts(matrix))
+    print(totals.to_string(float_format="${:,.2f}".format))
+    if args.cooccurrence:
+        print("\n------ Transactions with both labels ---------")
+        print(get_cooccurrence(matrix).to_string())
+
+
+if __name__ == "__main__":
+    main()
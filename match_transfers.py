@@ -0,0 +1,168 @@
+"""match_transfers.py
+
+    Pair up the two legs of transfers and credit card payments, ie: the debit
+    from a checking account and the credit to a credit card account, and
+    report the legs that couldn't be paired.
+
+    Transactions in the Spending Groups listed in TRANSFER_GROUPS are paired
+    when one is a debit and the other is a credit for the same amount, they
+    are in different accounts, and their dates are no more than
+    TRANSFER_TOLERANCE_DAYS apart.  Unmatched legs usually mean that a
+    transaction is missing or miscategorized in one of the accounts.
+
+    Usage:
+        python match_transfers.py [--days DAYS] [--output CSV_FILE]
+"""
+import argparse
+import pandas as pd
+
+# Import local helper modules
+import extract_spending_data_methods as esd
+import read_mint_transaction_data as rmtd
+
+# Import shared configuration file
+import expenses_config as ec
+
+TRANSFER_GROUPS = getattr(ec, "TRANSFER_GROUPS", ["Credit Card Payment", "Transfer"])
+TRANSFER_TOLERANCE_DAYS = getattr(ec, "TRANSFER_TOLERANCE_DAYS", 3)
+
+
+def get_transfer_legs(df, transfer_groups=TRANSFER_GROUPS):
+    """
+    Returns the transactions in the transfer_groups Spending Groups, not
+    indexed on date, with a "Leg ID" column set to each transaction's position
+    """
+    if df.index.name == "Date":
+        df = df.reset_index()
+    legs = df[df["Spending Group"].isin(transfer_groups)].reset_index(drop=True)
+    legs.insert(0, "Leg ID", legs.index)
+    return legs
+
+
+def pair_transfers(legs, tolerance_days=TRANSFER_TOLERANCE_DAYS, max_rounds=10):
+    """
+    Returns a dataframe with a row for each pair of debit and credit legs
+    that have the same amount, are in different accounts and are no more than
+    tolerance_days apart.  Each leg is used in at most one pair.
+
+    Each round finds the closest earlier and later credit in another account
+    for every unpaired debit with as-of joins on Date by Amount, two for each
+    account.  The closest candidates are paired, and the debits that lost out
+    to a closer one try again in the next round with the credits that are left
+    """
+    columns = ["Leg ID", "Date", "Amount", "Account Name"]
+    debits = legs.loc[legs["Transaction Type"] == "debit", columns].sort_values("Date")
+    credits = legs.loc[legs["Transaction Type"] == "credit", columns].sort_values(
+        "Date"
+    )
+    credits.columns = ["Credit " + col for col in columns]
+    credits = credits.rename(columns={"Credit Amount": "Amount"})
+    tolerance = pd.Timedelta(days=tolerance_days)
+
+    pairs = []
+    for _ in range(max_rounds):
+        if debits.empty or credits.empty:
+            break
+        candidates = pd.concat(
+            [
+                pd.merge_asof(
+                    account_debits,
+                    credits[credits["Credit Account Name"] != account],
+                    left_on="Date",
+                    right_on="Credit Date",
+                    by="Amount",
+                    direction=direction,
+                    tolerance=tolerance,
+                )
+                for account, account_debits in debits.groupby("Account Name")
+                for direction in ["backward", "forward"]
+            ]
+        ).dropna(subset=["Credit Leg ID"])
+        candidates["Days Apart"] = (
+            candidates["Credit Date"] - candidates["Date"]
+        ).dt.days.abs()
+        matched = (
+            candidates.sort_values("Days Apart", kind="stable")
+            .drop_duplicates("Leg ID")
+            .drop_duplicates("Credit Leg ID")
+        )
+        if matched.empty:
+            break
+        pairs.append(matched)
+        debits = debits[~debits["Leg ID"].isin(matched["Leg ID"])]
+        credits = credits[~credits["Credit Leg ID"].isin(matched["Credit Leg ID"])]
+
+    if not len(pairs):
+        empty_columns = columns + list(credits.columns) + ["Days Apart"]
+        pairs = [pd.DataFrame(columns=empty_columns)]
+    pairs = pd.concat(pairs, ignore_index=True)
+    pairs["Credit Leg ID"] = pairs["Credit Leg ID"].astype(int)
+    return pairs.rename(columns={"Leg ID": "Debit Leg ID"})
+
+
+def find_unmatched_transfers(df, tolerance_days=TRANSFER_TOLERANCE_DAYS):
+    """
+    Returns the transactions in the TRANSFER_GROUPS Spending Groups that
+    could not be paired with a transaction in another account
+    """
+    legs = get_transfer_legs(df)
+    pairs = pair_transfers(legs, tolerance_days)
+    paired = pd.concat([pairs["Debit Leg ID"], pairs["Credit Leg ID"]])
+    return legs[~legs["Leg ID"].isin(paired)].drop(columns="Leg ID")
+
+
+def summarize_unmatched_transfers(unmatched):
+    """
+    Returns the number and total amount of the unmatched debits and credits
+    for each account and year
+    """
+    summary = unmatched.groupby(
+        ["Account Name", unmatched["Date"].dt.year.rename("Year"), "Transaction Type"]
+    )["Amount"].agg(["count", "sum"])
+    summary = summary.unstack("Transaction Type", fill_value=0)
+    summary.columns = [
+        f"Unmatched {tran_type.title()} {'Count' if stat == 'count' else 'Amount'}"
+        for stat, tran_type in summary.columns
+    ]
+    return summary
+
+
+def report_unmatched_transfers(df, tolerance_days=TRANSFER_TOLERANCE_DAYS):
+    """Prints the unmatched transfer legs by account and year"""
+    unmatched = find_unmatched_transfers(df, tolerance_days)
+    print(f"\n------ Unmatched {', '.join(TRANSFER_GROUPS)} Transactions ---------")
+    if unmatched.empty:
+        print("All transfers were matched with a transaction in another account")
+    else:
+        print(
+            f"Found {len(unmatched)} transactions without a matching transaction "
+            f"in another account within {tolerance_days} days:"
+        )
+        print(summarize_unmatched_transfers(unmatched).to_string())
+    return unmatched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Pair up the {', '.join(TRANSFER_GROUPS)} transactions in "
+        f"{ec.PATH_TO_YOUR_TRANSACTIONS}"
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=TRANSFER_TOLERANCE_DAYS,
+        help="number of days apart that the two legs of a transfer can be",
+    )
+    parser.add_argument("--output", help="write the unmatched transactions to this csv")
+    args = parser.parse_args()
+
+    df = rmtd.read_mint_transaction_csv(ec.PATH_TO_YOUR_TRANSACTIONS)
+    df = esd.group_categories(df, ec.PATH_TO_SPENDING_GROUPS)
+    unmatched = report_unmatched_transfers(df, args.days)
+    if args.output:
+        print(f"Writing the unmatched transactions to {args.output}")
+        unmatched.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
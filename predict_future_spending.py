@@ -4,6 +4,10 @@
    that may be useful to predict future spending
 """
 import visualization_methods as vms
+import aggregate_cube as cube
+import forecast_spending as fs
+import simulate_retirement_spending as srs
+import numpy as np
 import webbrowser
 import os
 import sys
@@ -13,62 +17,97 @@ import expenses_config as ec
 
 # HTML report this module will generate
 HTML_OUT = ec.REPORTS_PATH + "fulture-spending.html"
-HTML_F = open(HTML_OUT, "w")
-
-# Create a dataframe from the annual spending by group data file
-df = vms.read_structured_transactions(
-    ec.PATH_TO_SPENDING_BY_GROUP,
-    ec.PATH_TO_YOUR_TRANSACTIONS,
-    "Spending Group",
-    "summarized spending group data",
-)
-
-# year over year visualizations we may have different categories each year
-# Create an assigned color for each category so the colors are consistent
-colors = vms.assign_colors_to_groups(df)
-
-# Remove old and current year data to generate a good average
-minyr = 3000
-maxyr = 1900
-for col in df.columns:
-    year = int(col.split(" ", 1)[0])
-    if year < ec.IGNORE_YEARS_BEFORE or year == ec.CURRENT_YEAR:
-        del df[col]
-    elif year < minyr:
-        minyr = year
-    elif year > maxyr:
-        maxyr = year
-
-# Make sure we have some data to work with
-if len(df.columns) <= 0:
-    print("No complete year data to work with. Exiting.")
-    sys.exit(0)
-
-# Create a new column with the average annual spending by group
-df["Average"] = df.mean(numeric_only=True, axis=1)
-# Drop spending groups that have an average of zero spending
-df = df[df["Average"] != 0]
-
-report_png = "average-spending-by-category.png"
-title = title = "Average Annual Spending " + str(minyr) + " - " + str(maxyr)
-vms.visualize_average_spending_by_group(df, title, colors, ec.REPORTS_PATH + report_png)
-print("<image src=./" + report_png + ">", file=HTML_F)
-
-# Remove certain spending groups that should not be applicable in retirement
-ret_df = df
-for group in ec.EXCLUDE_FROM_RETIREMENT:
-    ret_df = ret_df[ret_df.index != group]
-
-report_png = "projected-retirement-spending-by-category.png"
-vms.visualize_average_spending_by_group(
-    ret_df, "Projected Retirement Spending", colors, ec.REPORTS_PATH + report_png
-)
-print("<br>", file=HTML_F)
-print("<image src=./" + report_png + ">", file=HTML_F)
-
-
-# Show the report in a webbrowser
-HTML_F.close()
-webbrowser.open(
-    "file://" + os.path.realpath(HTML_OUT), new=2
-)  # new=2: open in a new tab, if possible
+
+
+def main():
+    HTML_F = open(HTML_OUT, "w")
+
+    # Create a dataframe with the annual spending by group
+    df = cube.get_annual_totals(cube.read_cube(), "spending")
+
+    # year over year visualizations we may have different categories each year
+    # Create an assigned color for each category so the colors are consistent
+    colors = vms.assign_colors_to_groups(df)
+
+    # Remove old and current year data to generate a good average
+    columns, years = fs.get_year_columns(df)
+    complete = fs.complete_year(years)
+    df = df[np.array(columns)[complete]]
+
+    # Make sure we have some data to work with
+    if len(df.columns) <= 0:
+        print("No complete year data to work with. Exiting.")
+        sys.exit(0)
+    minyr = years[complete].min()
+    maxyr = years[complete].max()
+
+    # Create a new column with the average annual spending by group
+    df["Average"] = df.mean(numeric_only=True, axis=1)
+    # Drop spending groups that have an average of zero spending
+    df = df[df["Average"] != 0]
+
+    report_png = "average-spending-by-category.png"
+    title = "Average Annual Spending " + str(minyr) + " - " + str(maxyr)
+    vms.visualize_average_spending_by_group(
+        df, title, colors, ec.REPORTS_PATH + report_png
+    )
+    print("<image src=./" + report_png + ">", file=HTML_F)
+
+    # Groups with a negative average were left out of the chart, so leave
+    # them out of the projections and forecasts too
+    df = df[df["Average"] >= 0]
+
+    # Remove certain spending groups that should not be applicable in retirement
+    ret_df = df
+    for group in ec.EXCLUDE_FROM_RETIREMENT:
+        ret_df = ret_df[ret_df.index != group]
+
+    report_png = "projected-retirement-spending-by-category.png"
+    vms.visualize_average_spending_by_group(
+        ret_df, "Projected Retirement Spending", colors, ec.REPORTS_PATH + report_png
+    )
+    print("<br>", file=HTML_F)
+    print("<image src=./" + report_png + ">", file=HTML_F)
+
+    # Simulate many paths of retirement spending instead of a single projection
+    totals, group_averages = srs.simulate_spending(ret_df.drop(columns="Average"))
+    total_bands, group_bands = srs.get_percentile_bands(
+        totals, group_averages, ret_df.index, maxyr + 1
+    )
+    report_png = "simulated-retirement-spending.png"
+    vms.visualize_spending_bands(
+        total_bands,
+        f"Simulated Retirement Spending ({srs.SIMULATION_PATHS:,} paths)",
+        ec.REPORTS_PATH + report_png,
+    )
+    print("<br>", file=HTML_F)
+    print("<image src=./" + report_png + ">", file=HTML_F)
+    print(
+        "<H3><center>Simulated Average Annual Retirement Spending "
+        "(today's dollars)</center></H3>",
+        file=HTML_F,
+    )
+    print(group_bands.to_html(float_format="${:,.2f}".format), file=HTML_F)
+
+    # Forecast the spending in each group for the next few years
+    forecast_df, weights_df = fs.forecast_spending(df.drop(columns="Average"))
+    forecast_df.loc["Total"] = forecast_df.sum()
+    print(
+        f"<H2><center>Forecast Spending ({fs.FORECAST_METHOD} of models)</center></H2>",
+        file=HTML_F,
+    )
+    print(forecast_df.to_html(float_format="${:,.2f}".format), file=HTML_F)
+    print(
+        "<H3><center>Weight of each model by Spending Group</center></H3>", file=HTML_F
+    )
+    print(weights_df.to_html(float_format="{:.2f}".format), file=HTML_F)
+
+    # Show the report in a webbrowser
+    HTML_F.close()
+    webbrowser.open(
+        "file://" + os.path.realpath(HTML_OUT), new=2
+    )  # new=2: open in a new tab, if possible
+
+
+if __name__ == "__main__":
+    main()
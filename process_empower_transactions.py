@@ -5,10 +5,13 @@
 import pandas as pd
 import numpy as np
 import sys
+import time
 import expenses_config as ec
 
 
 # Replace the category with the label for a given row
+# This is the original row by row implementation, which is kept as the
+# reference for benchmark_use_tags_as_categories
 def use_tag_as_category(row, skip_categories=[]):
     if row["Category"] in skip_categories:
         print(
@@ -36,6 +39,43 @@ def use_tag_as_category(row, skip_categories=[]):
     return row
 
 
+def use_tags_as_categories(df, skip_categories=[]):
+    """
+    Replaces the Category with the Label for every transaction that has one,
+    saving the original category in a new "Empower Category" column.
+
+    Transactions in any of the skip_categories keep their Category.  If any
+    of the Labels are malformed or have multiple tags, all of the problem
+    transactions are listed and the program exits so they can be cleaned up
+    """
+    skipped = df["Category"].isin(skip_categories)
+    if skipped.any():
+        print(f"Skipping {skipped.sum()} transactions in {list(skip_categories)}:")
+        print(df.loc[skipped, ["Date", "Description", "Amount", "Category"]])
+
+    labeled = df["Labels"].notna() & ~skipped
+    if not labeled.any():
+        return df
+
+    labels = df.loc[labeled, "Labels"].astype(str)
+    improperly_split = labels == ", "
+    multiple_tags = ~improperly_split & labels.str.contains(",", regex=False)
+    if improperly_split.any() or multiple_tags.any():
+        problem_cols = ["Date", "Description", "Amount", "Category", "Labels"]
+        if improperly_split.any():
+            print("Found improperly split transactions:")
+            print(df.loc[improperly_split[improperly_split].index, problem_cols])
+        if multiple_tags.any():
+            print("Multiple tags found for transactions:")
+            print(df.loc[multiple_tags[multiple_tags].index, problem_cols])
+        print("Please fix them manually and rerun")
+        sys.exit(0)
+
+    df.loc[labeled, "Empower Category"] = df.loc[labeled, "Category"]
+    df.loc[labeled, "Category"] = labels
+    return df
+
+
 def empower_to_mint_format(empower_transactions):
     """
     Reads an export of transaction data from Empower, ie:
@@ -77,11 +117,9 @@ def empower_to_mint_format(empower_transactions):
     # Category with the label
     if hasattr(ec, "USE_EMPOWER_LABELS"):
         if hasattr(ec, "SKIP_CATEGORIES"):
-            empower_df = empower_df.apply(
-                use_tag_as_category, args=(ec.SKIP_CATEGORIES), axis=1
-            )
+            empower_df = use_tags_as_categories(empower_df, ec.SKIP_CATEGORIES)
         else:
-            empower_df = empower_df.apply(use_tag_as_category, axis=1)
+            empower_df = use_tags_as_categories(empower_df)
 
     # Index on the date
     empower_df.set_index(["Date"], inplace=True)
@@ -112,11 +150,66 @@ def compare_csv_files(file1, file2, file3):
     return list(categories_not_in_file2_or_file3)
 
 
+def build_synthetic_empower_transactions(num_transactions, seed=0):
+    """
+    Returns a dataframe that looks like a large Empower export after it has
+    been read and renamed by empower_to_mint_format, for benchmarking
+    """
+    rng = np.random.default_rng(seed)
+    categories = np.array(["Groceries", "Restaurants", "Travel", "Rent", "Shopping"])
+    labels = np.array(["Vacation", "Kids", "Work Travel", "Gifts", "Home Office"])
+    df = pd.DataFrame(
+        {
+            "Date": pd.Timestamp("2010-01-01")
+            + pd.to_timedelta(rng.integers(0, 5000, num_transactions), unit="D"),
+            "Account Name": rng.choice(["Checking", "Visa", "Amex"], num_transactions),
+            "Description": rng.choice(["Store", "Cafe", "Airline"], num_transactions),
+            "Category": rng.choice(categories, num_transactions),
+            "Labels": rng.choice(labels, num_transactions),
+            "Amount": rng.integers(100, 100000, num_transactions) / 100,
+        }
+    )
+    # Most transactions don't have a label
+    df.loc[rng.random(num_transactions) < 0.7, "Labels"] = np.nan
+    return df
+
+
+def benchmark_use_tags_as_categories(num_transactions=100000):
+    """
+    Compares the time it takes to replace categories with labels row by row
+    with use_tag_as_category, and for the whole dataframe at once with
+    use_tags_as_categories
+    """
+    df = build_synthetic_empower_transactions(num_transactions)
+    print(f"Replacing categories with labels for {num_transactions} transactions")
+
+    start = time.perf_counter()
+    by_row_df = df.copy().apply(use_tag_as_category, axis=1)
+    by_row_secs = time.perf_counter() - start
+    print(f"Row by row with apply: {by_row_secs:.3f} seconds")
+
+    start = time.perf_counter()
+    vectorized_df = use_tags_as_categories(df.copy())
+    vectorized_secs = time.perf_counter() - start
+    print(f"All rows at once:      {vectorized_secs:.3f} seconds")
+
+    if not by_row_df[vectorized_df.columns].equals(vectorized_df):
+        print("Warning: the results of the two approaches differ!")
+    print(f"Speedup: {by_row_secs / vectorized_secs:.0f}x")
+
+
 def main():
     """
-    Read in empower data
+    Read in empower data, or benchmark the label conversion if run with
+    --benchmark [number of transactions]
     """
-    empower_to_mint_format(ec.PATH_TO_NEW_TRANSACTIONS)
+    if len(sys.argv) >= 2 and sys.argv[1] == "--benchmark":
+        if len(sys.argv) >= 3:
+            benchmark_use_tags_as_categories(int(sys.argv[2]))
+        else:
+            benchmark_use_tags_as_categories()
+    else:
+        empower_to_mint_format(ec.PATH_TO_NEW_TRANSACTIONS)
 
 
 if __name__ == "__main__":
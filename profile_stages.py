@@ -0,0 +1,222 @@
+"""profile_stages.py
+
+    Measure where the time goes when transactions are read, merged, grouped,
+    excluded, matched to refunds, written and rendered.
+
+    Set PROFILE_STAGES = True in expenses_config.py to record the wall time,
+    CPU time, rows in and out, and bytes read and written for each stage of a
+    run.  When the script exits the stages are written to
+    REPORTS_PATH/profile-<script>.json, or .csv if PROFILE_FORMAT is "csv".
+    Set PROFILE_CPROFILE_STAGE to the name of a stage, ie: "merge", to also
+    save a cProfile of the runs of that stage to REPORTS_PATH/<stage>.prof,
+    which can be viewed with "python -m pstats".  Only one run of the stage is
+    profiled at a time, so a run that overlaps another in a different thread
+    is left out.
+
+    The CPU time is that of the thread that ran the stage, so stages that run
+    at the same time in different threads, ie: the merges, don't count each
+    other's work.  Stages whose work is done in other processes, ie: render,
+    have no CPU time.
+
+    Stages are marked with the profile_stage decorator, for functions that
+    take and return a dataframe, or the stage context manager, ie:
+        with ps.stage("read", files_read=[path]) as s:
+            df = pd.read_csv(path)
+            s.rows_out = len(df)
+
+    When profiling is off, stage returns a shared stage that records nothing,
+    so marking a stage only costs a check of PROFILE_STAGES.
+"""
+import atexit
+import cProfile
+import csv
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Import the shared configuration file
+import expenses_config as ec
+
+PROFILE_STAGES = getattr(ec, "PROFILE_STAGES", False)
+PROFILE_FORMAT = getattr(ec, "PROFILE_FORMAT", "json")
+PROFILE_CPROFILE_STAGE = getattr(ec, "PROFILE_CPROFILE_STAGE", None)
+
+PROFILE_COLUMNS = [
+    "Stage",
+    "Parent",
+    "Thread",
+    "Start Seconds",
+    "Wall Seconds",
+    "CPU Seconds",
+    "Rows In",
+    "Rows Out",
+    "Bytes Read",
+    "Bytes Written",
+]
+
+_records = []
+_records_lock = threading.Lock()
+_open_stages = threading.local()
+_stage_profiler = cProfile.Profile()
+_stage_profiler_active = False
+_run_start = time.perf_counter()
+_run_started_at = datetime.datetime.now()
+
+
+def file_size(path):
+    """Returns the size of a file, or 0 if it doesn't exist"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Stage:
+    """Records one run of a stage from when it is entered until it exits.
+    rows_in, rows_out, bytes_read and bytes_written can be set in the body
+    """
+
+    def __init__(
+        self, name, rows_in=None, files_read=(), files_written=(), measure_cpu=True
+    ):
+        self.name = name
+        self.measure_cpu = measure_cpu
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_read = sum(file_size(path) for path in files_read)
+        self.bytes_written = 0
+        self.files_written = list(files_written)
+        self.profiler = None
+
+    def __enter__(self):
+        global _stage_profiler_active
+        stack = getattr(_open_stages, "stack", None)
+        if stack is None:
+            stack = _open_stages.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        if self.name == PROFILE_CPROFILE_STAGE:
+            with _records_lock:
+                # Skip the run if another one is already being profiled, ie:
+                # it is nested or running in another thread
+                if not _stage_profiler_active:
+                    _stage_profiler_active = True
+                    self.profiler = _stage_profiler
+            if self.profiler is not None:
+                # Each run adds to the same profile
+                self.profiler.enable()
+        self.cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _stage_profiler_active
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu_start
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(f"{ec.REPORTS_PATH}{self.name}.prof")
+            with _records_lock:
+                _stage_profiler_active = False
+        _open_stages.stack.pop()
+        self.bytes_written += sum(file_size(path) for path in self.files_written)
+        record = {
+            "Stage": self.name,
+            "Parent": self.parent,
+            "Thread": threading.current_thread().name,
+            "Start Seconds": round(self.start - _run_start, 6),
+            "Wall Seconds": round(wall, 6),
+            "CPU Seconds": round(cpu, 6) if self.measure_cpu else None,
+            "Rows In": self.rows_in,
+            "Rows Out": self.rows_out,
+            "Bytes Read": self.bytes_read,
+            "Bytes Written": self.bytes_written,
+        }
+        with _records_lock:
+            if not _records:
+                atexit.register(write_profile)
+            _records.append(record)
+        return False
+
+
+class NullStage:
+    """A stage that records nothing, used when profiling is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+def stage(name, rows_in=None, files_read=(), files_written=(), measure_cpu=True):
+    """Returns a context manager that records a run of the named stage
+
+    files_read - files whose sizes are added to the bytes read
+    files_written - files whose sizes, once the stage is done, are added to
+                    the bytes written
+    measure_cpu - set to False if the work is done in other processes, so
+                  the CPU time of this thread would be misleading
+    """
+    if not PROFILE_STAGES:
+        return NULL_STAGE
+    return Stage(name, rows_in, files_read, files_written, measure_cpu)
+
+
+def profile_stage(name):
+    """Decorator that records each call of a function as a run of the named
+    stage.  The rows in and out are the lengths of the first argument and the
+    return value, when they have one
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_STAGES:
+                return func(*args, **kwargs)
+            rows_in = len(args[0]) if args and hasattr(args[0], "__len__") else None
+            with Stage(name, rows_in) as s:
+                result = func(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    s.rows_out = len(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_profile_path():
+    """Returns the file the profile of this run is written to"""
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    extension = "csv" if PROFILE_FORMAT == "csv" else "json"
+    return f"{ec.REPORTS_PATH}profile-{script}.{extension}"
+
+
+def write_profile(path=None):
+    """Writes the stages recorded in this run to a json or csv file"""
+    path = path or get_profile_path()
+    with _records_lock:
+        records = list(_records)
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=PROFILE_COLUMNS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        profile = {
+            "command": sys.argv,
+            "started": _run_started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - _run_start, 6),
+            "stages": records,
+        }
+        with open(path, "w") as f:
+            json.dump(profile, f, indent=2)
+    print(f"Wrote the timing of {len(records)} stages to {path}")
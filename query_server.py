@@ -0,0 +1,345 @@
+"""query_server.py
+
+    A small local HTTP server for ad hoc questions about the transactions,
+    ie: how much was spent on Travel in each quarter of 2022 and 2023, without
+    editing a notebook or running the reports again.
+
+    The ledger in PATH_TO_YOUR_TRANSACTIONS and the aggregates written by
+    extract_spending_and_income.py to PATH_TO_AGGREGATES are read once and kept
+    in memory.  The results of the last QUERY_CACHE_SIZE queries are cached,
+    and when either file changes it is read again and the cache is cleared.
+
+    Queries are made with GET /query and these parameters, which return the
+    total Amount and Count for each group as json:
+    - source: "aggregates" (the default) or "ledger".  Ledger amounts are
+      net of credits, and aggregates are by month
+    - kind: "spending" (the default) or "income", for the aggregates
+    - by: a column to group by, repeat it to group by more than one
+    - period: also group by "month", "quarter", "fiscal year" or "year"
+    - from, to: the first and last dates to include, ie: 2022-07-01
+    - contains: only ledger transactions with this text in the Description
+    - any other column: only rows with this value, repeat it for more values
+    GET /status returns the rows in memory and the cache statistics.
+
+    Usage:
+        python query_server.py serve [--port PORT]
+        python query_server.py query [--port PORT] [--source ledger]
+            [--by COLUMN ...] [--period quarter] [--from DATE] [--to DATE]
+            [--contains TEXT] [--where COLUMN=VALUE ...]
+    ie: python query_server.py query --by "Spending Group" --period quarter \\
+            --where "Spending Group=Travel" --from 2022-07-01 --to 2023-09-30
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+# Import local helper modules
+import aggregate_cube as cube
+import aggregate_periods as ap
+import convert_currency as cc
+import read_mint_transaction_data as rmtd
+
+# Import the shared configuration file
+import expenses_config as ec
+
+QUERY_SERVER_PORT = getattr(ec, "QUERY_SERVER_PORT", 8765)
+QUERY_CACHE_SIZE = getattr(ec, "QUERY_CACHE_SIZE", 256)
+
+SOURCES = ["aggregates", "ledger"]
+QUERY_PERIODS = [period for period in ap.PERIODS if period != "rolling 12 months"]
+# Parameters that aren't column filters
+QUERY_OPTIONS = {"source", "kind", "by", "period", "from", "to", "contains"}
+
+
+def read_ledger(path):
+    """Returns the ledger with a Date column, the Amount in the base currency
+    net of credits and a Count of 1 for each transaction, ready to be summed
+    """
+    try:
+        df = rmtd.read_mint_transaction_csv(
+            path, index_on_date=False, check_for_latest=False
+        )
+    except SystemExit:
+        raise ValueError(f"Failed to read the transactions in {path}")
+    try:
+        df = cc.convert_to_base_currency(df)
+    except SystemExit:
+        raise ValueError(f"Failed to convert the transactions in {path}")
+    df["Amount"] = np.where(
+        df["Transaction Type"] == "credit", -df["Amount"], df["Amount"]
+    )
+    df["Count"] = 1
+    return df
+
+
+def read_aggregates(path):
+    """Returns the aggregates with a Date column for the first day of each month"""
+    df = pd.read_csv(path, dtype={"Month": str})
+    df["Date"] = pd.to_datetime(df["Month"], format="%Y-%m")
+    return df
+
+
+def run_query(df, params):
+    """Returns a dataframe with the total Amount and Count of the rows of df
+    that match the query, for each group
+
+    df - the ledger or aggregates, with Date, Amount and Count columns
+    params - a dict mapping each query parameter to a list of values
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if "from" in params:
+        mask &= (df["Date"] >= pd.Timestamp(params["from"][0])).to_numpy()
+    if "to" in params:
+        mask &= (df["Date"] <= pd.Timestamp(params["to"][0])).to_numpy()
+    if "contains" in params:
+        if "Description" not in df.columns:
+            raise ValueError("contains can only be used with the ledger")
+        mask &= (
+            df["Description"]
+            .str.contains(params["contains"][0], case=False, regex=False, na=False)
+            .to_numpy()
+        )
+    for column, values in params.items():
+        if column in QUERY_OPTIONS:
+            continue
+        if column not in df.columns:
+            raise ValueError(f'Unknown column "{column}"')
+        mask &= df[column].astype(str).isin(values).to_numpy()
+    df = df[mask]
+
+    for column in params.get("by", []):
+        if column not in df.columns:
+            raise ValueError(f'Unknown column "{column}"')
+    keys = [df[column] for column in params.get("by", [])]
+    if "period" in params:
+        period = params["period"][0]
+        if period not in QUERY_PERIODS:
+            raise ValueError(f'Unknown period "{period}", use one of {QUERY_PERIODS}')
+        codes = ap.get_period_codes(df["Date"], period) if len(df) else []
+        keys.append(pd.Series(codes, index=df.index, name="Period", dtype=str))
+    if not keys:
+        return df[["Amount", "Count"]].sum().to_frame().T
+    return df.groupby(keys)[["Amount", "Count"]].sum().reset_index()
+
+
+class QueryStore:
+    """Keeps the ledger and aggregates in memory, and caches query results
+    until one of the files they were read from changes
+    """
+
+    def __init__(self, ledger_path=None, aggregates_path=None, cache_size=None):
+        self.paths = {
+            "ledger": ledger_path or ec.PATH_TO_YOUR_TRANSACTIONS,
+            "aggregates": aggregates_path or cube.PATH_TO_AGGREGATES,
+        }
+        self.cache_size = cache_size or QUERY_CACHE_SIZE
+        self.cache = OrderedDict()
+        self.frames = {}
+        self.mtimes = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_frame(self, source):
+        """Returns the ledger or aggregates, reading them again if the file
+        has changed.  Call with the lock held
+        """
+        path = self.paths[source]
+        for required in {path, self.paths["ledger"]}:
+            if not os.path.isfile(required):
+                raise ValueError(f"{required} not found")
+        mtime = os.path.getmtime(path)
+        if source == "aggregates" and mtime < os.path.getmtime(self.paths["ledger"]):
+            raise ValueError(
+                f"{path} is older than {self.paths['ledger']}.  "
+                'Please run "python extract_spending_and_income.py" first.'
+            )
+        if self.mtimes.get(source) != mtime:
+            reader = read_ledger if source == "ledger" else read_aggregates
+            self.frames[source] = reader(path)
+            self.mtimes[source] = mtime
+            self.cache.clear()
+            print(f"Read {len(self.frames[source])} rows from {path}")
+        return self.frames[source]
+
+    def query(self, params):
+        """Returns the query result as a dict that can be sent as json"""
+        params = {key: list(values) for key, values in params.items()}
+        source = params.pop("source", ["aggregates"])[0]
+        if source not in SOURCES:
+            raise ValueError(f'Unknown source "{source}", use one of {SOURCES}')
+        if source == "aggregates":
+            params["Kind"] = params.pop("kind", ["spending"])
+        key = (source, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+
+        with self.lock:
+            df = self.get_frame(source)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return dict(self.cache[key], cached=True)
+            self.misses += 1
+
+        # The frames are only replaced, never changed, so the query can run
+        # without holding the lock
+        result = run_query(df, params).round({"Amount": 2})
+        result = {
+            "columns": list(result.columns),
+            "rows": json.loads(result.to_json(orient="values", date_format="iso")),
+            "total": round(float(result["Amount"].sum()), 2),
+        }
+        with self.lock:
+            # Don't cache a result from a frame that was read again meanwhile
+            if self.frames.get(source) is df:
+                self.cache[key] = result
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    def status(self):
+        with self.lock:
+            return {
+                "rows": {source: len(df) for source, df in self.frames.items()},
+                "paths": self.paths,
+                "cached_queries": len(self.cache),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+            }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers GET /query and GET /status with json"""
+
+    store = None
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        start = time.perf_counter()
+        try:
+            if url.path == "/query":
+                params = urllib.parse.parse_qs(url.query)
+                body = self.store.query(params)
+            elif url.path == "/status":
+                body = self.store.status()
+            else:
+                self.send_json(404, {"error": f"Unknown path {url.path}"})
+                return
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except OSError as e:
+            # ie: a file was removed while it was being read
+            self.send_json(500, {"error": str(e)})
+            return
+        body["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        self.send_json(200, body)
+
+
+def serve(port=QUERY_SERVER_PORT):
+    """Serves queries on localhost until interrupted"""
+    QueryHandler.store = QueryStore()
+    # Read the data now so the first query doesn't have to wait for it
+    with QueryHandler.store.lock:
+        for source in SOURCES:
+            try:
+                QueryHandler.store.get_frame(source)
+            except ValueError as e:
+                print(e)
+    server = ThreadingHTTPServer(("127.0.0.1", port), QueryHandler)
+    print(f"Serving queries on http://127.0.0.1:{port}/query")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def send_query(params, port=QUERY_SERVER_PORT):
+    """Returns the server's json response to a query"""
+    url = f"http://127.0.0.1:{port}/query?" + urllib.parse.urlencode(params, True)
+    try:
+        with urllib.request.urlopen(url) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+
+def main():
+    # --port can be given before or after the command
+    port_parser = argparse.ArgumentParser(add_help=False)
+    port_parser.add_argument("--port", type=int, default=argparse.SUPPRESS)
+    parser = argparse.ArgumentParser(
+        description="Query the transactions", parents=[port_parser]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", parents=[port_parser], help="start the query server")
+    query_parser = commands.add_parser(
+        "query", parents=[port_parser], help="send a query to the server"
+    )
+    query_parser.add_argument("--source", choices=SOURCES, default="aggregates")
+    query_parser.add_argument("--kind", choices=["spending", "income"])
+    query_parser.add_argument("--by", nargs="+", default=[])
+    query_parser.add_argument("--period", choices=QUERY_PERIODS)
+    query_parser.add_argument("--from", dest="from_date", help="ie: 2022-07-01")
+    query_parser.add_argument("--to", dest="to_date", help="ie: 2022-09-30")
+    query_parser.add_argument("--contains", help="text in the Description")
+    query_parser.add_argument(
+        "--where", nargs="+", default=[], metavar="COLUMN=VALUE"
+    )
+    args = parser.parse_args()
+    port = getattr(args, "port", QUERY_SERVER_PORT)
+
+    if args.command == "serve":
+        serve(port)
+        return
+
+    params = {"source": [args.source], "by": args.by}
+    options = {
+        "kind": args.kind,
+        "period": args.period,
+        "from": args.from_date,
+        "to": args.to_date,
+        "contains": args.contains,
+    }
+    params.update({key: [value] for key, value in options.items() if value})
+    for condition in args.where:
+        column, _, value = condition.partition("=")
+        params.setdefault(column, []).append(value)
+
+    try:
+        response = send_query(params, port)
+    except urllib.error.URLError as e:
+        print(f"Failed to reach the query server: {e.reason}")
+        print('Start it with "python query_server.py serve"')
+        sys.exit(-1)
+    if "error" in response:
+        print(response["error"])
+        sys.exit(-1)
+    result = pd.DataFrame(response["rows"], columns=response["columns"])
+    print(result.to_string(index=False, float_format="${:,.2f}".format))
+    print(
+        f"Total: ${response['total']:,.2f} "
+        f"({response['elapsed_ms']}ms{', cached' if response['cached'] else ''})"
+    )
+
+
+if __name__ == "__main__":
+    main()
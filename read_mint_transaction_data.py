@@ -4,12 +4,45 @@
 
 import pandas as pd
 import datetime
+import glob
+import json
+import multiprocessing
 import os
 import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import process_empower_transactions as pet
+import profile_stages as ps
 import expenses_config as ec
 
+# Columns found in the header of each supported transaction export format
+MINT_COLUMNS = {"Date", "Description", "Amount", "Transaction Type", "Account Name"}
+EMPOWER_COLUMNS = {"Date", "Account", "Description", "Amount", "Category", "Tags"}
+LUNCHMONEY_COLUMNS = {"date", "payee", "amount", "category_name", "tags"}
+
+# All the columns of transactions in mint format, in order
+MINT_FORMAT_COLUMNS = [
+    "Date",
+    "Description",
+    "Original Description",
+    "Amount",
+    "Transaction Type",
+    "Category",
+    "Account Name",
+    "Labels",
+    "Notes",
+]
+
+# Columns that identify the same transaction in overlapping exports
+EXPORT_KEY_COLUMNS = [
+    "Date",
+    "Description",
+    "Amount",
+    "Transaction Type",
+    "Category",
+    "Account Name",
+]
+
 
 def get_latest_transaction_file(path_to_data, query_user=True):
     # Check if there is a file named transactions-YYYY-MM-DD.csv in the same
@@ -36,15 +69,144 @@ def get_latest_transaction_file(path_to_data, query_user=True):
     return path_to_data
 
 
+def get_account_ledgers():
+    """
+    Returns a dict of the prefix of each additional transaction file to the
+    list of accounts whose transactions belong in that file, as configured by
+    ACCOUNT_LEDGERS and/or THIRD_PARTY_ACCOUNTS and THIRD_PARTY_PREFIX
+    """
+    ledgers = {}
+    if hasattr(ec, "THIRD_PARTY_ACCOUNTS") and hasattr(ec, "THIRD_PARTY_PREFIX"):
+        ledgers[ec.THIRD_PARTY_PREFIX] = list(ec.THIRD_PARTY_ACCOUNTS)
+    if hasattr(ec, "ACCOUNT_LEDGERS"):
+        for prefix, accounts in ec.ACCOUNT_LEDGERS.items():
+            ledgers.setdefault(prefix, []).extend(accounts)
+    return ledgers
+
+
+def route_accounts(df, ledgers):
+    """
+    Splits df into a dict of dataframes, one for each prefix in ledgers, with
+    the transactions for the accounts routed to that prefix. The transactions
+    for all other accounts are returned under the "" prefix.
+
+    Each account is mapped to its prefix once, and the transactions are
+    split in a single pass on that mapping
+    """
+    account_to_ledger = {
+        account: prefix for prefix, accounts in ledgers.items() for account in accounts
+    }
+    ledger = pd.Categorical(
+        df["Account Name"].map(account_to_ledger).fillna(""),
+        categories=[""] + [prefix for prefix in ledgers if prefix != ""],
+    )
+    parts = {prefix: df.iloc[0:0] for prefix in ledger.categories}
+    parts.update({prefix: part for prefix, part in df.groupby(ledger, observed=True)})
+    return parts
+
+
 def extract_accounts(df, acct_list):
-    my_accounts = df[~df["Account Name"].isin(acct_list)]
-    their_accounts = df[df["Account Name"].isin(acct_list)]
+    parts = route_accounts(df, {"their": acct_list})
 
-    return (my_accounts, their_accounts)
+    return (parts[""], parts["their"])
 
 
-def get_new_transaction_data(trans, data_format):
+def is_transaction_export_collection(path):
+    """Returns true if path is a directory or a glob pattern of export files"""
+    return os.path.isdir(path) or glob.has_magic(path)
+
+
+def find_transaction_exports(path):
+    """Returns the csv files in a directory, or that match a glob pattern,
+    from the oldest to the newest"""
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.csv")
+    return sorted(glob.glob(path), key=os.path.getmtime)
+
+
+def detect_transaction_format(path):
+    """Returns "mint", "empower" or "lunchmoney" based on the header of the
+    transaction export in path, or None if the format is not recognized"""
+    columns = set(pd.read_csv(path, nrows=0).columns)
+    if MINT_COLUMNS.issubset(columns):
+        return "mint"
+    elif EMPOWER_COLUMNS.issubset(columns):
+        return "empower"
+    elif LUNCHMONEY_COLUMNS.issubset(columns):
+        return "lunchmoney"
+    return None
+
+
+def read_transaction_export(path):
+    """Reads a transaction export in any supported format and returns it in
+    mint format, not indexed on date"""
+    data_format = detect_transaction_format(path)
+    print(f"Reading {data_format} transactions from {path}")
     if data_format == "mint":
+        return read_mint_transaction_csv(
+            path, index_on_date=False, check_for_latest=False
+        )
+    elif data_format == "empower":
+        return pet.empower_to_mint_format(path).reset_index()
+    elif data_format == "lunchmoney":
+        # Only needed for lunchmoney caches, which require the lunchable client
+        import get_lunchmoney_transactions as glt
+
+        df = glt.read_cached_lm_transactions(path)
+        if df.empty:
+            # An empty cache isn't converted to mint format
+            df = pd.DataFrame(columns=MINT_FORMAT_COLUMNS)
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df
+    else:
+        print(f"Did not recognize the format of the transactions in {path}")
+        sys.exit(-1)
+
+
+def read_transaction_exports(path, max_workers=None):
+    """
+    Reads all the transaction exports in a directory, or that match a glob
+    pattern, in parallel and returns a single dataframe of the transactions
+    in mint format, not indexed on date.
+
+    Exports often overlap, so transactions found in more than one file are
+    only kept once.  Identical transactions within a single export, ie: two
+    coffees on the same day, are all kept.
+    """
+    files = find_transaction_exports(path)
+    if not len(files):
+        print(f"Did not find any transaction exports in {path}")
+        sys.exit(-1)
+
+    # add_new_transactions calls this from a worker thread, and forking a
+    # process that has other threads running can deadlock the children, so
+    # the workers are spawned instead
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        dfs = list(pool.map(read_transaction_export, files))
+
+    # Number repeats of the same transaction within each export so that only
+    # transactions repeated across exports are treated as duplicates
+    for df in dfs:
+        df["Occurrence"] = df.groupby(EXPORT_KEY_COLUMNS, dropna=False).cumcount()
+    # Empty exports are left out so they don't change the column types
+    all_df = pd.concat([df for df in dfs if len(df)] or dfs, ignore_index=True)
+    df = all_df.drop_duplicates(
+        subset=EXPORT_KEY_COLUMNS + ["Occurrence"], keep="last"
+    ).drop(columns="Occurrence")
+    print(
+        f"Found {len(df)} unique transactions in the {len(all_df)} transactions "
+        f"from {len(files)} exports in {path}"
+    )
+    return df.reset_index(drop=True)
+
+
+def get_new_transaction_data(trans, data_format):
+    if is_transaction_export_collection(trans):
+        df = read_transaction_exports(trans)
+        df.set_index(["Date"], inplace=True)
+    elif data_format == "mint":
         df = read_mint_transaction_csv(trans)
     elif data_format == "empower":
         df = pet.empower_to_mint_format(ec.PATH_TO_NEW_TRANSACTIONS)
@@ -55,18 +217,18 @@ def get_new_transaction_data(trans, data_format):
     return df
 
 
-def extract_their_accounts_and_get_mine(
-    trans, data_format, account_list, output, prefix=""
-):
+def extract_their_accounts_and_get_mine(trans, data_format, output, ledgers):
     df = get_new_transaction_data(trans, data_format)
-    (my_df, their_df) = extract_accounts(df, ec.THIRD_PARTY_ACCOUNTS)
-    if len(their_df):
-        # Write out the 3rd party data
-        print(
-            f"Will write {len(their_df)} transactions to the "
-            f"{ec.THIRD_PARTY_PREFIX} transactions file"
-        )
-        output_new_transaction_data(their_df, output, prefix)
+    parts = route_accounts(df, ledgers)
+    for prefix, their_df in parts.items():
+        if prefix != "" and len(their_df):
+            # Write out the 3rd party data
+            print(
+                f"Will write {len(their_df)} transactions to the "
+                f"{prefix} transactions file"
+            )
+            output_new_transaction_data(their_df, output, prefix)
+    my_df = parts[""]
     if len(my_df):
         # Write out a clean version of my transaction data
         print(f"Will write remaining transactions to {output}")
@@ -87,7 +249,54 @@ def output_new_transaction_data(df, outfile, prefix=""):
         )
         outfile = os.path.join(dir_name, file_name)
 
-    df.to_csv(f"{outfile}")
+    with ps.stage("write", rows_in=len(df), files_written=[outfile]):
+        df.to_csv(f"{outfile}")
+        write_transaction_metadata(df, outfile)
+
+
+def transaction_metadata_file(path_to_data):
+    """Returns the name of the small json file that describes a transaction file"""
+    return os.path.splitext(path_to_data)[0] + ".meta.json"
+
+
+def write_transaction_metadata(df, path_to_data):
+    """Writes the latest transaction date and the number of transactions
+    in df to a metadata file next to the transaction file it was written to.
+
+    This allows callers to find out how current a transaction file is without
+    reading and parsing the whole thing
+    """
+    dates = df.index if df.index.name == "Date" else df["Date"]
+    metadata = {
+        "latest_date": pd.to_datetime(dates).max().strftime("%Y-%m-%d"),
+        "transactions": len(df),
+    }
+    with open(transaction_metadata_file(path_to_data), "w") as f:
+        json.dump(metadata, f)
+
+
+def get_latest_transaction_date(path_to_data):
+    """Returns the date of the most recent transaction in a transaction file
+
+    The date is taken from the file's metadata when it is at least as new as
+    the transaction file.  Otherwise only the Date column is read
+    """
+    meta_file = transaction_metadata_file(path_to_data)
+    if os.path.isfile(meta_file) and os.path.getmtime(meta_file) >= os.path.getmtime(
+        path_to_data
+    ):
+        try:
+            with open(meta_file) as f:
+                return pd.Timestamp(json.load(f)["latest_date"])
+        except BaseException as e:
+            print(f"Ignoring unreadable transaction metadata {meta_file}: {e}")
+
+    try:
+        dates = pd.read_csv(path_to_data, usecols=["Date"])["Date"]
+    except BaseException as e:
+        print("Failed to read mint transaction data: {}".format(e))
+        sys.exit(-1)
+    return pd.to_datetime(dates).max()
 
 
 def new_transactions_available(trans, new_trans):
@@ -100,44 +309,57 @@ def new_transactions_available(trans, new_trans):
     new_trans - filename with new transactions to add
     """
     trans = get_latest_transaction_file(trans, False)
+    if is_transaction_export_collection(new_trans):
+        new_trans_files = find_transaction_exports(new_trans)
+        if not len(new_trans_files):
+            return False
+        new_trans_mtime = os.path.getmtime(new_trans_files[-1])
+    else:
+        new_trans_mtime = os.path.getmtime(new_trans)
     if not os.path.isfile(trans):
         print(f"Did not find a {trans} file.")
         # Edge case - new transactions exist, but historical ones don't yet
         # If configured split the transaction data
-        if hasattr(ec, "THIRD_PARTY_ACCOUNTS") and hasattr(ec, "THIRD_PARTY_PREFIX"):
+        ledgers = get_account_ledgers()
+        if len(ledgers):
             extract_their_accounts_and_get_mine(
-                new_trans,
-                ec.NEW_TRANSACTION_SOURCE,
-                ec.THIRD_PARTY_ACCOUNTS,
-                trans,
-                ec.THIRD_PARTY_PREFIX,
+                new_trans, ec.NEW_TRANSACTION_SOURCE, trans, ledgers
             )
         else:
             # New transactions are the only transactions!
             print(f"Will use {new_trans} as the basis for a new local {trans} file.")
-            shutil.copy(new_trans, trans)
+            if is_transaction_export_collection(new_trans):
+                output_new_transaction_data(
+                    get_new_transaction_data(new_trans, ec.NEW_TRANSACTION_SOURCE),
+                    trans,
+                )
+            else:
+                shutil.copy(new_trans, trans)
         return False
-    elif os.path.getmtime(new_trans) > os.path.getmtime(trans):
+    elif new_trans_mtime > os.path.getmtime(trans):
         return True
     else:
         return False
 
 
-def read_mint_transaction_csv(path_to_data, index_on_date=True):
+def read_mint_transaction_csv(path_to_data, index_on_date=True, check_for_latest=True):
     # See if we have an update transaction data file from a previous run today
-    path_to_data = get_latest_transaction_file(path_to_data)
+    if check_for_latest:
+        path_to_data = get_latest_transaction_file(path_to_data)
     # Read the raw mint transaction data into a dataframe
     parse_dates = ["Date"]
     try:
-        df = pd.read_csv(path_to_data, parse_dates=parse_dates)
-        df["Amount"] = df["Amount"].astype(float)
-        df['Date'] = pd.to_datetime(df['Date'])
-        # For some reason there is often a space before the account name
-        # Clean this up until I can figure out why it's happening
-        df["Account Name"] = df["Account Name"].str.strip()
-
-        if index_on_date:
-            df.set_index(["Date"], inplace=True)
+        with ps.stage("read", files_read=[path_to_data]) as s:
+            df = pd.read_csv(path_to_data, parse_dates=parse_dates)
+            df["Amount"] = df["Amount"].astype(float)
+            df['Date'] = pd.to_datetime(df['Date'])
+            # For some reason there is often a space before the account name
+            # Clean this up until I can figure out why it's happening
+            df["Account Name"] = df["Account Name"].str.strip()
+
+            if index_on_date:
+                df.set_index(["Date"], inplace=True)
+            s.rows_out = len(df)
     except BaseException as e:
         # TODO - print a warning and return an empty df?
         # Maybe add a parameter for this
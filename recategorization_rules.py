@@ -0,0 +1,183 @@
+"""recategorization_rules.py
+
+    Fix the categories that come from Mint, Empower or LunchMoney with a file
+    of rules instead of editing the transaction csv by hand.
+
+    Each row in the PATH_TO_RECATEGORIZATION_RULES csv has a regular
+    expression in the "Pattern" column that is matched, ignoring case, anywhere
+    in a transaction's Description.  Any of the "Category", "Spending Group"
+    and "Merchant" columns that are set override that value for the matching
+    transactions.  When more than one rule matches, the first one in the file
+    wins.  See recategorization-rules-template.csv for an example.
+
+    - Categories are replaced when new transactions are added to the local
+      transaction data
+    - Spending Groups are replaced whenever categories are grouped
+    - Merchants replace the normalized merchant name used to match refunds
+      and find recurring charges
+
+    The rules are compiled once, and only matched once for each unique
+    description.
+
+    Usage:
+        python recategorization_rules.py
+    Reports how many of the transactions in PATH_TO_YOUR_TRANSACTIONS each
+    rule matches, and how many of their categories it would change
+"""
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+
+# Import shared configuration file
+import expenses_config as ec
+
+RULE_COLUMNS = ["Pattern", "Category", "Spending Group", "Merchant"]
+
+_compiled_rules = {}
+_missing_rules = set()
+
+
+def get_rules_path():
+    """Returns the configured rules file, or None if there isn't one"""
+    return getattr(ec, "PATH_TO_RECATEGORIZATION_RULES", None)
+
+
+def read_recategorization_rules(path):
+    """Returns a dataframe with a row for each rule in the rules csv"""
+    try:
+        rules = pd.read_csv(path, dtype=str)
+    except BaseException as e:
+        print("Failed to read recategorization rules from", path, file=sys.stderr)
+        print("The exception: {}".format(e), file=sys.stderr)
+        raise e
+    if "Pattern" not in rules.columns:
+        print(f'{path} must have a "Pattern" column', file=sys.stderr)
+        sys.exit(-1)
+    rules = rules.reindex(columns=RULE_COLUMNS).dropna(subset=["Pattern"])
+    return rules.reset_index(drop=True)
+
+
+def compile_rules(rules):
+    """
+    Returns a list with the compiled regular expression of each rule.  Exits
+    after listing the rules with patterns that aren't valid
+    """
+    compiled = []
+    bad_rules = []
+    for i, pattern in enumerate(rules["Pattern"]):
+        try:
+            compiled.append(re.compile(pattern, re.IGNORECASE | re.DOTALL))
+        except re.error as e:
+            bad_rules.append(f"  row {i + 2}: {pattern} ({e})")
+    if len(bad_rules):
+        print("Invalid recategorization rule patterns:")
+        print("\n".join(bad_rules))
+        sys.exit(-1)
+    return compiled
+
+
+def find_first_rule(patterns, description):
+    """Returns the number of the first rule that matches, or -1 if none do"""
+    for number, pattern in enumerate(patterns):
+        if pattern.search(description):
+            return number
+    return -1
+
+
+def load_rules(path=None):
+    """
+    Returns the rules dataframe, the compiled patterns and the memo of the
+    rule matched by each description for the rules csv, or None if no rules
+    file is configured or it doesn't exist.  Each rules file is only read and
+    compiled once unless it is modified
+    """
+    path = path or get_rules_path()
+    if path is None:
+        return None
+    if not os.path.isfile(path):
+        if path not in _missing_rules:
+            print(f"Recategorization rules file {path} not found, no rules applied")
+            _missing_rules.add(path)
+        return None
+    mtime = os.path.getmtime(path)
+    if path not in _compiled_rules or _compiled_rules[path][0] != mtime:
+        rules = read_recategorization_rules(path)
+        _compiled_rules[path] = (mtime, rules, compile_rules(rules), {})
+    return _compiled_rules[path][1:]
+
+
+def match_rules(descriptions, path=None):
+    """
+    Returns a series with the number of the first rule that matches each
+    description, or -1 when no rule does.  Each unique description is only
+    matched once, and the result is remembered for later calls
+    """
+    loaded = load_rules(path)
+    if loaded is None or loaded[0].empty:
+        return pd.Series(-1, index=descriptions.index)
+    (rules, patterns, rule_numbers) = loaded
+    for description in descriptions.dropna().unique():
+        if description not in rule_numbers:
+            rule_numbers[description] = find_first_rule(patterns, description)
+    return descriptions.map(rule_numbers).fillna(-1).astype(int)
+
+
+def get_rule_values(descriptions, column, path=None, rule_numbers=None):
+    """
+    Returns a series with the value in column of the first matching rule
+    for each description, or None where no rule matches or sets it
+    """
+    if rule_numbers is None:
+        rule_numbers = match_rules(descriptions, path)
+    if (rule_numbers < 0).all():
+        return pd.Series(None, index=descriptions.index, dtype=object)
+    # The extra None at the end is picked up by the -1 for unmatched descriptions
+    values = np.append(load_rules(path)[0][column].to_numpy(dtype=object), None)
+    values = pd.Series(values[rule_numbers.to_numpy()], index=descriptions.index)
+    return values.where(values.notna(), None)
+
+
+def apply_category_rules(df, path=None, verbose=True):
+    """Replaces the Category of the transactions that match a rule"""
+    if (path or get_rules_path()) is None or df.empty:
+        return df
+    categories = get_rule_values(df["Description"], "Category", path)
+    changed = categories.notna() & (categories != df["Category"])
+    if changed.any():
+        if verbose:
+            print(f"Recategorized {changed.sum()} transactions using rules")
+        df.loc[changed, "Category"] = categories[changed]
+    return df
+
+
+def main():
+    path = get_rules_path()
+    if path is None:
+        print("Set PATH_TO_RECATEGORIZATION_RULES in expenses_config.py first")
+        sys.exit(-1)
+    # Imported here since reading the transactions is only needed for the report
+    import read_mint_transaction_data as rmtd
+
+    loaded = load_rules(path)
+    if loaded is None:
+        sys.exit(-1)
+    rules = loaded[0]
+    df = rmtd.read_mint_transaction_csv(
+        ec.PATH_TO_YOUR_TRANSACTIONS, index_on_date=False
+    )
+    rule_numbers = match_rules(df["Description"], path)
+    categories = get_rule_values(df["Description"], "Category", path, rule_numbers)
+    changes = rule_numbers[categories.notna() & (categories != df["Category"])]
+    report = rules.fillna("")
+    report["Matches"] = rule_numbers.value_counts().reindex(rules.index, fill_value=0)
+    report["Category Changes"] = changes.value_counts().reindex(
+        rules.index, fill_value=0
+    )
+    print(f"Matched {(rule_numbers >= 0).sum()} of {len(df)} transactions:")
+    print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+    Methods to resolve the conflicts found when new transactions are added to
+    a local csv of transaction data
+
+    A new transaction conflicts with the existing data when it has the same
+    Date, Amount, Account Name and Transaction Type as an existing transaction,
+    but a different Description or Category.  All of the conflicts in a batch
+    of new transactions are collected first and then resolved together with
+    one of these actions:
+    - prefer-new: overwrite the existing transaction's Description and Category
+    - prefer-old: ignore the new transaction
+    - keep-both: add the new transaction as another transaction
+
+    Conflicts are resolved by the first matching rule in the optional
+    PATH_TO_CONFLICT_POLICY file, and any that are left are reviewed by the
+    user in a single interactive pass.  Each decision is saved as soon as it
+    is made, so an interrupted review picks up where it left off, and
+    re-importing the same transactions replays the earlier decisions.
+"""
+import json
+import os
+import sys
+import threading
+import pandas as pd
+
+# Import shared configuration file
+import expenses_config as ec
+
+# Transactions for several transaction files may be added at the same time
+# This lock ensures that the user is only asked about one of them at a time
+prompt_lock = threading.Lock()
+
+CONFLICT_ACTIONS = ["prefer-new", "prefer-old", "keep-both"]
+RESPONSE_ACTIONS = {"o": "prefer-new", "i": "prefer-old", "a": "keep-both"}
+POLICY_COLUMNS = ["Account Name", "Category", "Action"]
+
+
+def decisions_file(outfile, prefix=""):
+    """Returns the json file where the decisions for a transaction file are kept"""
+    if prefix != "":
+        outfile = f"{prefix}-{outfile}"
+    return os.path.splitext(outfile)[0] + ".decisions.json"
+
+
+def read_decisions(path):
+    """Returns the dict of previously saved decisions, keyed by conflict"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Ignoring unreadable conflict decisions in {path}: {e}")
+        return {}
+
+
+def write_decisions(path, decisions):
+    """Saves the decisions, replacing the file so it is never left half written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(decisions, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def read_conflict_policy(path=None):
+    """
+    Returns a dataframe with the rules in the conflict policy csv, or None
+    if there isn't one.  A blank Account Name or Category matches any value
+    """
+    path = path or getattr(ec, "PATH_TO_CONFLICT_POLICY", None)
+    if path is None:
+        return None
+    try:
+        policy = pd.read_csv(path, dtype=str).reindex(columns=POLICY_COLUMNS)
+    except BaseException as e:
+        print("Failed to read the conflict policy from", path, file=sys.stderr)
+        print("The exception: {}".format(e), file=sys.stderr)
+        raise e
+    policy["Action"] = policy["Action"].str.strip().str.lower()
+    bad_actions = policy[~policy["Action"].isin(CONFLICT_ACTIONS)]
+    if not bad_actions.empty:
+        print(
+            f"Unknown conflict policy actions in {path}: "
+            f"{bad_actions['Action'].tolist()}.  Use one of {CONFLICT_ACTIONS}"
+        )
+        sys.exit(-1)
+    return policy
+
+
+def get_policy_action(policy, row):
+    """Returns the action of the first policy rule that matches row, or None"""
+    if policy is None:
+        return None
+    matches = policy[
+        policy["Account Name"].isna() | (policy["Account Name"] == row["Account Name"])
+    ]
+    matches = matches[
+        matches["Category"].isna() | (matches["Category"] == row["Category"])
+    ]
+    return None if matches.empty else matches["Action"].iloc[0]
+
+
+def conflict_key(row, existing):
+    """
+    Returns the key a decision is saved under, made from the new transaction
+    and the Description and Category of the existing one it conflicts with
+    """
+    return "|".join(
+        [
+            row["Date"].strftime("%Y-%m-%d"),
+            row["Account Name"],
+            row["Transaction Type"],
+            f"{row['Amount']:.2f}",
+            str(row["Description"]),
+            str(row["Category"]),
+            str(existing["Description"]),
+            str(existing["Category"]),
+        ]
+    )
+
+
+def find_conflicts(new_df, old_df, fingerprints, fingerprint_columns):
+    """
+    Sorts the new transactions, which are not indexed, into the ones to add
+    and the ones that conflict with the existing transactions.  Each new
+    transaction is also compared to the ones before it in new_df that are
+    being added
+
+    Params:
+        fingerprints - index of old_df built by build_fingerprint_index
+
+    Returns:
+        a list of the positions in new_df of the transactions to add
+        a dict with the positions in new_df of the conflicting transactions
+        mapped to the positions of the transactions they conflict with, in
+        old_df with the transactions to add appended to it by
+        append_transactions
+    """
+    to_add = []
+    conflicts = {}
+    # The positions in new_df of the transactions being added, by fingerprint
+    added = {}
+    old_desc_cat = old_df[["Description", "Category"]].fillna("").to_numpy()
+    new_desc_cat = new_df[["Description", "Category"]].fillna("").to_numpy()
+    keys = new_df[fingerprint_columns].itertuples(index=False, name=None)
+    for pos, key in enumerate(keys):
+        old_matches = fingerprints.get(key, [])
+        new_matches = added.get(key, [])
+        if not len(old_matches) and not len(new_matches):
+            added.setdefault(key, []).append(pos)
+            to_add.append(pos)
+        elif not (
+            (old_desc_cat[old_matches] == new_desc_cat[pos]).all(axis=1).any()
+            or (new_desc_cat[new_matches] == new_desc_cat[pos]).all(axis=1).any()
+        ):
+            # Possible duplicate entry with new Description and/or Category
+            conflicts[pos] = list(old_matches) + [
+                len(old_df) + to_add.index(match) for match in new_matches
+            ]
+    return to_add, conflicts
+
+
+def append_transactions(old_df, new_df, positions):
+    """Returns old_df with the transactions at positions in new_df added"""
+    if not len(positions):
+        return old_df
+    return pd.concat([old_df, new_df.iloc[sorted(positions)]], ignore_index=True)
+
+
+def review_conflict(row, existing):
+    """Asks the user how to resolve a conflict, returns an action or None to quit"""
+    print("\nFound a possible duplicate entry with new Description and/or Category.")
+    print(
+        "{} {} {} {:.2f}".format(
+            row["Date"].strftime("%Y-%m-%d"),
+            row["Account Name"],
+            row["Transaction Type"],
+            row["Amount"],
+        )
+    )
+    print("Existing Description and Category:")
+    print(existing[["Description", "Category"]].values)
+    print("New Description and Category:")
+    print(row[["Description", "Category"]].values)
+    while True:
+        response = input("(O)verwrite, (A)dd as new, (I)gnore, or (Q)uit?").lower()
+        if response == "q":
+            return None
+        if response in RESPONSE_ACTIONS:
+            return RESPONSE_ACTIONS[response]
+
+
+def resolve_conflicts(conflicts, new_df, old_df, decisions_path, policy=None):
+    """
+    Returns a dict with the action for each conflict found by find_conflicts
+
+    Conflicts are resolved by a previously saved decision, then by the
+    conflict policy, and the rest are reviewed by the user in one pass.
+    Every decision the user makes is saved to decisions_path right away.  If the user
+    quits, the decisions so far are kept for the next run and nothing else
+    is changed
+    """
+    decisions = read_decisions(decisions_path)
+    actions = {}
+    to_review = []
+    for pos, matches in conflicts.items():
+        row = new_df.iloc[pos]
+        key = conflict_key(row, old_df.iloc[matches[0]])
+        action = decisions.get(key) or get_policy_action(policy, row)
+        if action is None:
+            to_review.append((pos, key))
+        else:
+            actions[pos] = action
+
+    replayed = len(actions)
+    if replayed:
+        print(
+            f"Resolved {replayed} possible duplicates using earlier decisions "
+            "and the conflict policy"
+        )
+    if len(to_review):
+        with prompt_lock:
+            print(f"\nPlease review {len(to_review)} possible duplicate transactions")
+            for num, (pos, key) in enumerate(to_review, 1):
+                print(f"\n({num} of {len(to_review)})", end="")
+                row = new_df.iloc[pos]
+                action = review_conflict(row, old_df.iloc[conflicts[pos][0]])
+                if action is None:
+                    print(
+                        f"Saved {len(decisions)} decisions to {decisions_path}. "
+                        "Run again to resume the review."
+                    )
+                    # Exit with an error so that nothing else is run on the
+                    # transaction data that was not updated
+                    sys.exit(-1)
+                actions[pos] = action
+                decisions[key] = action
+                write_decisions(decisions_path, decisions)
+    return actions
+
+
+def apply_resolutions(new_df, old_df, conflicts, actions):
+    """
+    Returns the existing transactions with the new ones that are kept as well
+    added, and the number of existing transactions that were overwritten.
+    Overwrites are made in place and all of the additions are made with a
+    single concat
+    """
+    to_add = []
+    num_overwritten = 0
+    for pos, matches in conflicts.items():
+        if actions[pos] == "prefer-new":
+            row = new_df.iloc[pos]
+            old_df.loc[old_df.index[matches], ["Description", "Category"]] = [
+                row["Description"],
+                row["Category"],
+            ]
+            num_overwritten += 1
+        elif actions[pos] == "keep-both":
+            to_add.append(pos)
+    return append_transactions(old_df, new_df, to_add), num_overwritten
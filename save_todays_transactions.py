@@ -6,6 +6,7 @@
     This is the last program run by the run-all.sh script.
 
 """
+import os
 import shutil
 
 import read_mint_transaction_data as rmtd
@@ -27,6 +28,10 @@ def move_csv_file(trans):
         if answer.lower() == "y":
             # Move file1 to file2
             shutil.move(todays, trans)
+            # Keep the transaction file's metadata with it
+            todays_meta = rmtd.transaction_metadata_file(todays)
+            if os.path.isfile(todays_meta):
+                shutil.move(todays_meta, rmtd.transaction_metadata_file(trans))
             print(f"{todays} has been moved to {trans}.")
     else:
         print(f"{trans} was not updated today.")
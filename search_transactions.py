@@ -0,0 +1,272 @@
+"""search_transactions.py
+
+    Find transactions by the words in their Description or Original
+    Description, and total them by year and Spending Group, ie: to see what
+    is behind a jump in spending, without filtering the whole ledger.
+
+    The words are kept in an inverted index that maps each word to the
+    transactions it appears in.  The index is saved next to the transaction
+    file, ie: transactions.search.pkl, and is updated as new transactions are
+    merged in by add_new_transactions.py.  Only the transactions that were
+    added or changed are indexed each time.  If the transaction file is newer
+    than its index, the index is brought up to date before searching.
+
+    Every word in the search must match.  A word ending in * matches any word
+    that starts with it, ie: starb*, and --fuzzy also matches words that are
+    spelled a little differently, ie: starbuks.
+
+    Usage:
+        python search_transactions.py WORD [WORD ...] [--fuzzy] [--show N]
+"""
+import argparse
+import bisect
+import difflib
+import os
+import pickle
+import re
+import time
+import numpy as np
+import pandas as pd
+
+# Import local helper modules
+import convert_currency as cc
+import extract_spending_data_methods as esd
+import read_mint_transaction_data as rmtd
+
+# Import the shared configuration file
+import expenses_config as ec
+
+SEARCH_FUZZY_CUTOFF = getattr(ec, "SEARCH_FUZZY_CUTOFF", 0.8)
+
+# Columns kept in the index for showing and totaling the matches
+INDEX_COLUMNS = [
+    "Date",
+    "Description",
+    "Original Description",
+    "Amount",
+    "Transaction Type",
+    "Category",
+    "Account Name",
+    "Currency",
+]
+TEXT_COLUMNS = ["Description", "Original Description"]
+KEY_COLUMNS = ["Hash", "Copy"]
+TOKEN_PATTERN = r"[a-z0-9&']+"
+
+
+def search_index_file(path_to_data, prefix=""):
+    """Returns the file the search index for a transaction file is kept in"""
+    if prefix != "":
+        path_to_data = f"{prefix}-{path_to_data}"
+    return os.path.splitext(path_to_data)[0] + ".search.pkl"
+
+
+def get_row_keys(df):
+    """Returns a MultiIndex that identifies each transaction by a hash of its
+    columns and the number of identical transactions before it
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    occurrences = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([hashes, occurrences], names=KEY_COLUMNS)
+
+
+def build_postings(docs):
+    """Returns a dict mapping each word in the docs to a sorted array of the
+    ids of the docs it appears in
+    """
+    text = docs[TEXT_COLUMNS[0]].fillna("")
+    for column in TEXT_COLUMNS[1:]:
+        text = text + " " + docs[column].fillna("")
+    words = text.str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+    words = pd.DataFrame({"Word": words.to_numpy(), "Doc": words.index})
+    words = words.drop_duplicates().sort_values(["Word", "Doc"])
+    return {
+        word: words["Doc"].to_numpy()[positions]
+        for word, positions in words.groupby("Word", sort=False).indices.items()
+    }
+
+
+def new_search_index():
+    """Returns an empty search index"""
+    return {
+        "docs": pd.DataFrame(columns=INDEX_COLUMNS + KEY_COLUMNS),
+        "postings": {},
+        "words": [],
+        "next_id": 0,
+    }
+
+
+def read_search_index(index_file):
+    """Returns the saved search index, or an empty one if there isn't one"""
+    try:
+        with open(index_file, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return new_search_index()
+    except (pickle.UnpicklingError, EOFError, KeyError) as e:
+        print(f"Rebuilding the unreadable search index {index_file}: {e}")
+        return new_search_index()
+
+
+def write_search_index(index_file, index):
+    """Saves the index, replacing the file so it is never left half written"""
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, index_file)
+
+
+def update_search_index(df, index_file, verbose=True):
+    """Brings the search index up to date with the transactions in df, and
+    saves it.  Only the transactions that aren't in the index already are
+    indexed, and the ones that are no longer in df are removed
+
+    Returns the updated index
+    """
+    index = read_search_index(index_file)
+    if df.index.name == "Date":
+        df = df.reset_index()
+    df = df.reindex(columns=INDEX_COLUMNS)
+    df["Date"] = pd.to_datetime(df["Date"])
+    keys = get_row_keys(df)
+    df["Hash"] = keys.get_level_values("Hash")
+    df["Copy"] = keys.get_level_values("Copy")
+
+    docs = index["docs"]
+    indexed_keys = pd.MultiIndex.from_frame(docs[KEY_COLUMNS])
+    removed = ~indexed_keys.isin(keys)
+    added = ~keys.isin(indexed_keys)
+    if removed.sum() > len(docs) / 2:
+        # Start over when much of the index is for transactions that are gone
+        index = new_search_index()
+        docs, added = index["docs"], np.ones(len(df), dtype=bool)
+    else:
+        docs = docs[~removed]
+
+    new_docs = df[added].set_axis(
+        pd.RangeIndex(index["next_id"], index["next_id"] + added.sum())
+    )
+    postings = index["postings"]
+    for word, doc_ids in build_postings(new_docs).items():
+        # New doc ids are larger than the existing ones, so the ids stay sorted
+        if word in postings:
+            doc_ids = np.concatenate([postings[word], doc_ids])
+        postings[word] = doc_ids
+    index = {
+        "docs": pd.concat([docs, new_docs]) if len(docs) else new_docs,
+        "postings": postings,
+        "words": sorted(postings),
+        "next_id": index["next_id"] + int(added.sum()),
+    }
+    write_search_index(index_file, index)
+    if verbose:
+        print(
+            f"Search index: indexed {int(added.sum())} transactions and "
+            f"removed {int(removed.sum())}"
+        )
+    return index
+
+
+def load_search_index(path_to_data=None):
+    """Returns the search index for a transaction file, updating it first if
+    the transaction file has changed since it was saved
+    """
+    path_to_data = path_to_data or ec.PATH_TO_YOUR_TRANSACTIONS
+    index_file = search_index_file(path_to_data)
+    latest_data = rmtd.get_latest_transaction_file(path_to_data, query_user=False)
+    if os.path.isfile(index_file) and os.path.getmtime(
+        index_file
+    ) >= os.path.getmtime(latest_data):
+        return read_search_index(index_file)
+    print(f"Updating the search index for {latest_data}")
+    df = rmtd.read_mint_transaction_csv(
+        latest_data, index_on_date=False, check_for_latest=False
+    )
+    return update_search_index(df, index_file)
+
+
+def lookup_word(index, word, fuzzy=False):
+    """Returns the sorted ids of the docs that contain a word, any word that
+    starts with it if it ends in *, or a word close to it if fuzzy is True
+    """
+    words = index["words"]
+    if word.endswith("*"):
+        word = word[:-1]
+        start = bisect.bisect_left(words, word)
+        end = bisect.bisect_left(words, word + "\uffff")
+        matches = words[start:end]
+    else:
+        matches = [word] if word in index["postings"] else []
+        if fuzzy:
+            matches += difflib.get_close_matches(
+                word, words, n=10, cutoff=SEARCH_FUZZY_CUTOFF
+            )
+    if not matches:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate([index["postings"][match] for match in matches]))
+
+
+def find_transactions(index, query, fuzzy=False):
+    """Returns the indexed transactions that match every word in the query"""
+    pattern = TOKEN_PATTERN + r"\*?"
+    words = [word for text in query for word in re.findall(pattern, text.lower())]
+    if not words:
+        return index["docs"].iloc[:0]
+    doc_ids = lookup_word(index, words[0], fuzzy)
+    for word in words[1:]:
+        doc_ids = np.intersect1d(doc_ids, lookup_word(index, word, fuzzy))
+    # Removed transactions are still in the postings until the index is rebuilt
+    doc_ids = index["docs"].index.intersection(doc_ids)
+    return index["docs"].loc[doc_ids, INDEX_COLUMNS]
+
+
+def summarize_matches(matches):
+    """Returns the net spending of the matches, in the base currency, by
+    Spending Group and year
+    """
+    matches = cc.convert_to_base_currency(matches.copy())
+    matches = esd.group_categories(matches, ec.PATH_TO_SPENDING_GROUPS)
+    amounts = matches["Amount"].where(
+        matches["Transaction Type"] != "credit", -matches["Amount"]
+    )
+    summary = amounts.groupby(
+        [matches["Spending Group"], matches["Date"].dt.year.rename("Year")]
+    ).sum()
+    summary = summary.unstack("Year", fill_value=0)
+    summary.loc["Total"] = summary.sum()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search the transactions by the words in their descriptions"
+    )
+    parser.add_argument("words", nargs="+", help="ie: starbucks, or starb*")
+    parser.add_argument(
+        "--fuzzy", action="store_true", help="also match similar words"
+    )
+    parser.add_argument(
+        "--show", type=int, default=20, help="number of matches to show"
+    )
+    args = parser.parse_args()
+
+    index = load_search_index()
+    start = time.perf_counter()
+    matches = find_transactions(index, args.words, args.fuzzy)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(
+        f"Found {len(matches)} of {len(index['docs'])} transactions "
+        f"in {elapsed:.1f}ms"
+    )
+    if matches.empty:
+        return
+    matches = matches.sort_values("Date", ascending=False)
+    print(matches.head(args.show).to_string(index=False))
+    if len(matches) > args.show:
+        print(f"... and {len(matches) - args.show} more")
+    print("\n------ Net Spending by Spending Group and Year ---------")
+    print(summarize_matches(matches).to_string(float_format="${:,.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@
     shows the annual income by category
 """
 import visualization_methods as vms
+import aggregate_cube as cube
 import webbrowser
 import os
 
@@ -15,21 +16,13 @@ import expenses_config as ec
 HTML_OUT = ec.REPORTS_PATH + "group-income_details.html"
 HTML_F = open(HTML_OUT, "w")
 
-# Create a dataframe from the annual income  by group data file
-df = vms.read_structured_transactions(
-    ec.OUTPUT_INCOME_DATA,
-    ec.PATH_TO_YOUR_TRANSACTIONS,
-    "Date",
-    "summarized income group data",
-)
+# Create a dataframe with the annual income by group and category
+df = cube.get_annual_totals(
+    cube.read_cube(), "income", ["Spending Group", "Category"]
+).reset_index()
 
-# Loop through each of the spending groups and show the year over year details
-for group in sorted(df["Spending Group"].unique()):
-    filtered_df = df.filter(regex='Amount|Category|Spending Group')
-    group_df = vms.build_category_details(filtered_df, group)
-    group_df.drop("Spending Group", axis=1, inplace=True)
-    print("<H2><center>Details for " + group + " income<center></H2>", file=HTML_F)
-    print(group_df.to_html(), file=HTML_F)
+# Show the year over year details for each of the spending groups
+vms.write_group_details(df, HTML_F, "income")
 
 # Show the report in a webbrowser
 HTML_F.close()
@@ -4,6 +4,8 @@
    year or the yearly average for the category
 """
 import visualization_methods as vms
+import aggregate_cube as cube
+import numpy as np
 import pandas as pd
 import webbrowser
 import os
@@ -16,42 +18,72 @@ import expenses_config as ec
 HTML_OUT = ec.REPORTS_PATH + "spending-category-trends.html"
 
 
+# Percent changes that are color coded, and the smallest change in dollars
+# that is worth color coding
+MINOR_CHANGE_PERCENT = getattr(ec, "TREND_MINOR_CHANGE_PERCENT", 10)
+MAJOR_CHANGE_PERCENT = getattr(ec, "TREND_MAJOR_CHANGE_PERCENT", 25)
+MIN_CHANGE_DOLLARS = getattr(ec, "TREND_MIN_CHANGE_DOLLARS", 500)
+
+
 # Function to color code spending by year
-def style_year_over_year(x, use_average=False):
-    # Create a DataFrame with the same shape, filled with empty strings
+def style_year_over_year(
+    x,
+    use_average=False,
+    minor=MINOR_CHANGE_PERCENT,
+    major=MAJOR_CHANGE_PERCENT,
+    min_dollars=MIN_CHANGE_DOLLARS,
+):
+    """Returns a DataFrame of styles with the same shape as x that color codes
+    each year by its percent change from the previous year or the average
+
+    The percent changes for every row and year are computed at once.  The
+    blank " " row, the first year and the "Average" column are not colored
+    """
+    values = x.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    current_year = values[:, 1:-1]
+    if use_average:
+        comp = values[:, -1:]
+    else:
+        comp = values[:, :-2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_change = (current_year - comp) / comp * 100
+
+    # Don't bother for small values, or where there is nothing to compare to
+    skip = (comp == 0) | (np.abs(comp - current_year) < min_dollars)
+    skip |= (x.index == " ")[:, np.newaxis]
+    percent_change[skip] = np.nan
+
+    cell_styles = np.select(
+        [
+            (-major <= percent_change) & (percent_change < -minor),
+            percent_change < -major,
+            (minor <= percent_change) & (percent_change < major),
+            percent_change > major,
+        ],
+        [
+            "background-color: green; color: white",
+            "background-color: blue; color: white",
+            "background-color: yellow; color: black",
+            "background-color: red; color: white",
+        ],
+        default="",
+    )
     styles = pd.DataFrame("", index=x.index, columns=x.columns)
-    avg_col = len(x.columns) - 1
-
-    # Loop through the DataFrame by rows
-    for row in range(0, len(x)):
-        if x.index[row] == " ":
-            continue
-        for col in range(1, len(x.columns) - 1):  # Exclude the 'average' column
-            # Calculate the percent change from the previous year or average
-            if use_average:
-                comp = x.iloc[row, avg_col]
-            else:
-                comp = x.iloc[row, col - 1]
-            current_year = x.iloc[row, col]
-            if comp != 0:  # Avoid division by zero
-                if abs(comp - current_year) < 500:
-                    # Don't bother for small values
-                    continue
-                percent_change = (current_year - comp) / comp * 100
-
-                # Apply color coding based on the conditions
-                if -25 <= percent_change < -10:
-                    styles.iloc[row, col] = "background-color: green; color: white"
-                elif percent_change < -25:
-                    styles.iloc[row, col] = "background-color: blue; color: white"
-                elif 10 <= percent_change < 25:
-                    styles.iloc[row, col] = "background-color: yellow; color: black"
-                elif percent_change > 25:
-                    styles.iloc[row, col] = "background-color: red; color: white"
-
+    styles.iloc[:, 1:-1] = cell_styles
     return styles
 
 
+def build_caption(compared_to, compared_to_short):
+    """Builds the caption that explains the color codes"""
+    return f"""
+<span style='color: green;'>Green</span>: {MINOR_CHANGE_PERCENT}-{MAJOR_CHANGE_PERCENT}% less than {compared_to_short},
+<span style='color: blue;'>Blue</span>: >{MAJOR_CHANGE_PERCENT}% less than {compared_to}
+<br>
+<span style='color: yellow;'>Yellow</span>: {MINOR_CHANGE_PERCENT}-{MAJOR_CHANGE_PERCENT}% more than {compared_to},
+<span style='color: red;'>Red</span>: >{MAJOR_CHANGE_PERCENT}% more than {compared_to}
+"""  # noqa
+
+
 # Function to format numbers as dollar amounts
 def format_dollars(val):
     try:
@@ -60,13 +92,8 @@ def format_dollars(val):
         return val  # Return the value as is if it can't be formatted
 
 
-# Create a dataframe from the annual spending by group data file
-df = vms.read_structured_transactions(
-    ec.PATH_TO_SPENDING_BY_GROUP,
-    ec.PATH_TO_YOUR_TRANSACTIONS,
-    "Spending Group",
-    "summarized spending group data",
-)
+# Create a dataframe with the annual spending by group
+df = cube.get_annual_totals(cube.read_cube(), "spending")
 
 # Make sure we have some data to work with
 if len(df.columns) <= 0:
@@ -88,13 +115,7 @@ sum_df = vms.build_summary_table(df, ret_df)
 
 caption = """
 Changes in Category Spending Year over Year -- Color Codes:
-<br>
-<span style='color: green;'>Green</span>: 10-25% less than the prev. year,
-<span style='color: blue;'>Blue</span>: >25% less than the previous year
-<br>
-<span style='color: yellow;'>Yellow</span>: 10-25% more than the previous year,
-<span style='color: red;'>Red</span>: >25% more than the previous year
-"""
+<br>""" + build_caption("the previous year", "the prev. year")
 
 table_styles = [
     {
@@ -126,13 +147,7 @@ print(styled_df.to_html(), file=HTML_F)
 caption = """
 <br>
 Yearly Spending by Category vs Average -- Color Codes:
-<br>
-<span style='color: green;'>Green</span>: 10-25% less than average,
-<span style='color: blue;'>Blue</span>: >25% less than average
-<br>
-<span style='color: yellow;'>Yellow</span>: 10-25% more than average,
-<span style='color: red;'>Red</span>: >25% more than average
-"""
+<br>""" + build_caption("average", "average")
 
 styled_df = (
     sum_df.style.apply(style_year_over_year, axis=None, use_average=True)
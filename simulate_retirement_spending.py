@@ -0,0 +1,190 @@
+"""simulate_retirement_spending.py
+
+    Simulate many possible paths of retirement spending from the history of
+    annual spending by Spending Group, instead of a single projection from
+    the average.
+
+    Each simulated year reuses the spending in every group from a randomly
+    chosen historical year, so that groups that tend to be high or low in the
+    same years stay that way.  The historical years are first converted to the
+    last year's dollars.  Each path has its own random inflation every year,
+    and each group can be hit by a random shock, ie: a year with a large
+    unexpected expense.
+
+    Paths are simulated in chunks of SIMULATION_CHUNK_PATHS, in parallel, to
+    bound the memory used.  The results are percentile bands for the total
+    spending in each future year, and for the average annual spending in each
+    group.
+
+    Usage:
+        python simulate_retirement_spending.py [--paths N] [--years N] [--seed N]
+"""
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Import local helper modules
+import aggregate_cube as cube
+import forecast_spending as fs
+
+# Import the shared configuration file
+import expenses_config as ec
+
+SIMULATION_PATHS = getattr(ec, "SIMULATION_PATHS", 10000)
+SIMULATION_YEARS = getattr(ec, "SIMULATION_YEARS", 30)
+SIMULATION_INFLATION_MEAN = getattr(ec, "SIMULATION_INFLATION_MEAN", 0.03)
+SIMULATION_INFLATION_STDEV = getattr(ec, "SIMULATION_INFLATION_STDEV", 0.01)
+SIMULATION_SHOCK_PROBABILITY = getattr(ec, "SIMULATION_SHOCK_PROBABILITY", 0.02)
+SIMULATION_SHOCK_SIZE = getattr(ec, "SIMULATION_SHOCK_SIZE", 2.0)
+SIMULATION_CHUNK_PATHS = getattr(ec, "SIMULATION_CHUNK_PATHS", 5000)
+SIMULATION_PERCENTILES = getattr(ec, "SIMULATION_PERCENTILES", [5, 25, 50, 75, 95])
+SIMULATION_SEED = getattr(ec, "SIMULATION_SEED", None)
+
+
+def simulate_chunk(
+    history,
+    num_paths,
+    num_years,
+    seed,
+    inflation_mean=SIMULATION_INFLATION_MEAN,
+    inflation_stdev=SIMULATION_INFLATION_STDEV,
+    shock_probability=SIMULATION_SHOCK_PROBABILITY,
+    shock_size=SIMULATION_SHOCK_SIZE,
+):
+    """Simulate num_paths paths of spending as a (paths x years x groups) array
+
+    history - a (historical years x groups) array of annual spending in
+              today's dollars
+    seed - a numpy SeedSequence, or int, for this chunk's random numbers
+
+    Returns the total spending for each path and year, including inflation,
+    and the average annual spending for each path and group in today's dollars
+    """
+    rng = np.random.default_rng(seed)
+    # Resample whole historical years so groups keep their correlation
+    sampled_years = rng.integers(0, len(history), size=(num_paths, num_years))
+    spending = history[sampled_years]
+
+    if shock_probability > 0:
+        shocks = rng.random(spending.shape) < shock_probability
+        spending[shocks] *= shock_size
+    group_averages = spending.mean(axis=1)
+
+    # Each path has its own inflation, compounded from today
+    inflation = rng.normal(inflation_mean, inflation_stdev, size=(num_paths, num_years))
+    totals = spending.sum(axis=2) * np.cumprod(1 + inflation, axis=1)
+    return totals, group_averages
+
+
+def simulate_spending(
+    df,
+    num_paths=SIMULATION_PATHS,
+    num_years=SIMULATION_YEARS,
+    seed=SIMULATION_SEED,
+    chunk_paths=SIMULATION_CHUNK_PATHS,
+    max_workers=None,
+    inflation_mean=SIMULATION_INFLATION_MEAN,
+    **kwargs,
+):
+    """Simulate future spending from the annual spending by group in df
+
+    df - a dataframe indexed by Spending Group with "YYYY Amount" columns of
+         complete years
+    inflation_mean - the average inflation, used to bring the history to
+                     today's dollars and to simulate future inflation
+    kwargs - the other inflation and shock settings passed to simulate_chunk
+
+    Returns a (paths x years) array of total spending, and a (paths x groups)
+    array of average annual spending
+    """
+    columns, years = fs.get_year_columns(df)
+    kwargs["inflation_mean"] = inflation_mean
+    growth = (1 + inflation_mean) ** (years.max() - years)
+    history = (df[columns].fillna(0).to_numpy(dtype=float) * growth).T
+
+    # Each chunk gets an independent random stream, so results don't depend
+    # on the number of workers
+    chunk_sizes = [chunk_paths] * (num_paths // chunk_paths)
+    if num_paths % chunk_paths:
+        chunk_sizes.append(num_paths % chunk_paths)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    args = [
+        (history, size, num_years, chunk_seed)
+        for size, chunk_seed in zip(chunk_sizes, seeds)
+    ]
+
+    if len(chunk_sizes) == 1 or max_workers == 1:
+        results = [simulate_chunk(*chunk_args, **kwargs) for chunk_args in args]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(simulate_chunk, *chunk_args, **kwargs)
+                for chunk_args in args
+            ]
+            results = [future.result() for future in futures]
+    totals = np.concatenate([result[0] for result in results])
+    group_averages = np.concatenate([result[1] for result in results])
+    return totals, group_averages
+
+
+def get_percentile_bands(
+    totals, group_averages, groups, first_year, percentiles=SIMULATION_PERCENTILES
+):
+    """Returns dataframes with the percentiles of the total spending in each
+    future year, and of the average annual spending in each group
+    """
+    columns = [f"{p}th Percentile" for p in percentiles]
+    total_bands = pd.DataFrame(
+        np.percentile(totals, percentiles, axis=0).T,
+        index=pd.Index(first_year + np.arange(totals.shape[1]), name="Year"),
+        columns=columns,
+    )
+    group_bands = pd.DataFrame(
+        np.percentile(group_averages, percentiles, axis=0).T,
+        index=groups,
+        columns=columns,
+    )
+    group_bands.loc["Total"] = np.percentile(
+        group_averages.sum(axis=1), percentiles
+    )
+    return total_bands, group_bands
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate retirement spending by group from "
+        f"{cube.PATH_TO_AGGREGATES}"
+    )
+    parser.add_argument("--paths", type=int, default=SIMULATION_PATHS)
+    parser.add_argument("--years", type=int, default=SIMULATION_YEARS)
+    parser.add_argument("--seed", type=int, default=SIMULATION_SEED)
+    args = parser.parse_args()
+
+    df = cube.get_annual_totals(cube.read_cube(), "spending")
+    columns, years = fs.get_year_columns(df)
+    complete = fs.complete_year(years)
+    df = df[np.array(columns)[complete]]
+    df = df[~df.index.isin(ec.EXCLUDE_FROM_RETIREMENT)]
+    years = years[complete]
+    if not len(years):
+        print(
+            "There isn't a complete year of spending to simulate from.  Check "
+            "IGNORE_YEARS_BEFORE and CURRENT_YEAR in expenses_config.py"
+        )
+        sys.exit(-1)
+
+    totals, group_averages = simulate_spending(df, args.paths, args.years, args.seed)
+    total_bands, group_bands = get_percentile_bands(
+        totals, group_averages, df.index, years.max() + 1
+    )
+    print(f"Simulated {args.paths} paths of {args.years} years of retirement spending")
+    print("\n------ Total Spending by Year ---------")
+    print(total_bands.to_string(float_format="${:,.2f}".format))
+    print("\n------ Average Annual Spending by Spending Group ---------")
+    print(group_bands.to_string(float_format="${:,.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
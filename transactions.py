@@ -11,17 +11,20 @@
    client for API access.
 """
 import ast
+import json
 import os
+import time
 import pandas as pd
 import sys
 from lunchable import LunchMoney
-from lunchable.models import TransactionUpdateObject
+from lunchable.models import CategoriesObject, TransactionUpdateObject
 import expenses_config as lmc
 
 sys.path.append("..")
 
 private_lunch = None
 categories = None
+category_index = None
 
 def init_lunchable(token):
     global private_lunch
@@ -70,11 +73,7 @@ def read_or_fetch_lm_transactions(start_date, end_date, csv_file_base, lunch=Non
     )
     if os.path.isfile(csv_file):
         # We have a cached version of the same transaction request written as a CSV
-        # Read it in from the CSV converting the tags field to an array of objects and
-        # the date field to a datatime object, just as they'd be returned by the API
-        converters = {'tags': lambda val: ast.literal_eval(val) if isinstance(val, str) else val}
-        df = pd.read_csv(csv_file, parse_dates=["date"], date_format="%Y-%m-%d", converters=converters)
-        df["date"] = pd.to_datetime(df["date"])
+        df = read_lm_transactions_csv(csv_file)
         print(f"Read {len(df)} transactions from {csv_file}.")
         print("Just delete this file if you want to re-fetch them again in the future.")
     else:
@@ -89,22 +88,129 @@ def read_or_fetch_lm_transactions(start_date, end_date, csv_file_base, lunch=Non
     return df
 
 
+def read_lm_transactions_csv(csv_file):
+    """Returns a dataframe of the lunchmoney transactions cached in csv_file
+
+    The tags field is converted to an array of objects and the date field to
+    a datetime object, just as they'd be returned by the API
+    """
+    converters = {'tags': lambda val: ast.literal_eval(val) if isinstance(val, str) else val}
+    df = pd.read_csv(csv_file, parse_dates=["date"], date_format="%Y-%m-%d", converters=converters)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
 def get_categories(lunch=None):
     """ If it hasn't been done yet, get's the categories from lunchmoney
     and stores them in the global variable categories
+
+    If LM_CATEGORIES_CACHE is configured the categories are read from that
+    file as long as it is younger than LM_CATEGORIES_CACHE_TTL_HOURS, otherwise
+    they are fetched via the API and the cache is rewritten
     """
     global categories
+    if categories is None:
+        categories = read_cached_categories()
     if categories is None:
         if lunch is None:
             lunch = init_lunchable(lmc.LUNCHMONEY_API_TOKEN)
         categories = lunch.get_categories()
+        write_cached_categories(categories)
     return categories
 
 
+def read_cached_categories():
+    """Returns the list of categories stored in LM_CATEGORIES_CACHE, or None
+    if no cache is configured, it doesn't exist, or it is older than the TTL
+    """
+    cache_file = getattr(lmc, "LM_CATEGORIES_CACHE", "")
+    if not cache_file or not os.path.isfile(cache_file):
+        return None
+    ttl_seconds = getattr(lmc, "LM_CATEGORIES_CACHE_TTL_HOURS", 24) * 60 * 60
+    if time.time() - os.path.getmtime(cache_file) > ttl_seconds:
+        print(f"Category cache {cache_file} has expired.  Will refetch categories.")
+        return None
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+        return [CategoriesObject.model_validate(category) for category in cached]
+    except BaseException as e:
+        print(f"Ignoring unreadable category cache {cache_file}: {e}")
+        return None
+
+
+def write_cached_categories(categories):
+    """Writes the categories to LM_CATEGORIES_CACHE if one is configured"""
+    cache_file = getattr(lmc, "LM_CATEGORIES_CACHE", "")
+    if not cache_file:
+        return
+    with open(cache_file, "w") as f:
+        json.dump([category.model_dump(mode="json") for category in categories], f)
+
+
+def get_category_index(lunch=None):
+    """Returns a dict of lookup tables built once from the category list:
+
+    name_to_id - category name to category id
+    id_to_name - category id to category name
+    id_to_group_id - category id to the id of its category group (if any)
+    group_to_ids - category group id to the list of its child category ids
+    """
+    global category_index
+    if category_index is None:
+        index = {
+            "name_to_id": {},
+            "id_to_name": {},
+            "id_to_group_id": {},
+            "group_to_ids": {},
+        }
+        for category in get_categories(lunch):
+            index["name_to_id"][category.name] = category.id
+            index["id_to_name"][category.id] = category.name
+            group_id = getattr(category, "group_id", None)
+            if group_id is not None:
+                index["id_to_group_id"][category.id] = group_id
+                index["group_to_ids"].setdefault(group_id, []).append(category.id)
+        category_index = index
+    return category_index
+
+
 def get_category_id_by_name(name, lunch=None):
     """ Returns the category id for the category with the specified name
     """
-    categories = get_categories(lunch)
-    category = next((category for category in categories if category.name == name), None)
-    return category.id if category else None
+    return get_category_index(lunch)["name_to_id"].get(name)
 
+
+def get_category_name_by_id(category_id, lunch=None):
+    """ Returns the category name for the category with the specified id
+    """
+    return get_category_index(lunch)["id_to_name"].get(category_id)
+
+
+def get_category_group_name(category_id, lunch=None):
+    """ Returns the name of the category group that the category with the
+    specified id belongs to, or None if it isn't part of a group
+    """
+    index = get_category_index(lunch)
+    group_id = index["id_to_group_id"].get(category_id)
+    return index["id_to_name"].get(group_id)
+
+
+def map_category_ids_to_names(category_ids, lunch=None):
+    """ Returns a series with the category name for each category id
+    in the category_ids series
+    """
+    return category_ids.map(get_category_index(lunch)["id_to_name"])
+
+
+def map_category_ids_to_spending_groups(category_ids, spending_group_map, lunch=None):
+    """ Returns a series with the Spending Group for each category id in the
+    category_ids series.
+
+    spending_group_map is a dict of category name to Spending Group, ie: as
+    returned by extract_spending_data_methods.read_spending_group_map.
+    Categories that are not assigned to a group keep their name as their
+    Spending Group, matching the behavior of group_categories
+    """
+    names = map_category_ids_to_names(category_ids, lunch)
+    return names.map(spending_group_map).fillna(names)
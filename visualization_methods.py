@@ -3,10 +3,65 @@
    of dataframes or series of spending and income
    information
 """
+import hashlib
+import json
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# Import local helper modules
+import profile_stages as ps
+
+# Name of the file in each report directory that records the hash of the
+# inputs that each chart in it was rendered from
+CHART_CACHE_MANIFEST = ".chart-cache.json"
+
+
+# The data needed to draw a pie chart, with the groups that can't be drawn removed
+ChartSpec = namedtuple("ChartSpec", ["series", "labels", "colors", "removed", "total"])
+
+# The most recently built chart specs, keyed by a hash of their inputs
+CHART_SPEC_CACHE_SIZE = 64
+_chart_specs = OrderedDict()
+
+
+def build_chart_spec(data, colors, keep_zero=False):
+    """Returns a ChartSpec for a pie chart of a series of amounts by group
+
+    data - a series with the amount for each group
+    colors - a dict of assigned matplotlib colormap vals for each group
+    keep_zero - keep groups with an amount of zero, otherwise only
+                positive amounts are kept
+
+    The series and colors passed in are not changed.  The last
+    CHART_SPEC_CACHE_SIZE specs are remembered, so building the spec for the
+    same data again costs nothing
+    """
+    key = (
+        hashlib.sha256(pd.util.hash_pandas_object(data).to_numpy().tobytes()).digest(),
+        data.name,
+        keep_zero,
+        tuple(colors.get(group) for group in data.index),
+    )
+    if key in _chart_specs:
+        _chart_specs.move_to_end(key)
+    else:
+        keep = (data >= 0) if keep_zero else (data > 0)
+        series = data[keep]
+        labels = list(series.index + series.map(": ${:,.2f}".format))
+        _chart_specs[key] = ChartSpec(
+            series=series,
+            labels=labels,
+            colors=[colors[group] for group in series.index],
+            removed=data[~keep & data.notna()],
+            total=series.sum(),
+        )
+        if len(_chart_specs) > CHART_SPEC_CACHE_SIZE:
+            _chart_specs.popitem(last=False)
+    return _chart_specs[key]
 
 
 # Function for generating a pie chart of expenses
@@ -20,36 +75,20 @@ def visualize_expenses_by_group(year, year_data, colors, out_file="", spending=T
     out_file - an optional output file to write the visualization to
     spending - optional.  Set to false if visualizing income transactions
     """
-    # Build a legend for a Pie Chart that includes the Spending Category and the Amount
-    legend_label = []
-    for idx in year_data.index:
-        if year_data.loc[idx] <= 0:
-            # Remove categories with "negative spending"
-            if year_data.loc[idx] < 0:
-                print(
-                    "Spending on "
-                    + idx
-                    + ": ${:,.2f}".format(year_data.loc[idx])
-                    + " was really income."
-                )
-            year_data.drop([idx], inplace=True)
-        else:
-            # Otherwise add the group name and amount to the legend
-            legend_label.append(idx + ": ${:,.2f}".format(year_data.loc[idx]))
-    expenses_for_year = year_data.sum()
+    # Remove categories with "negative spending"
+    spec = build_chart_spec(year_data, colors)
+    for group, amount in spec.removed[spec.removed < 0].items():
+        print(
+            "Spending on " + group + ": ${:,.2f}".format(amount) + " was really income."
+        )
 
     # Plot the chart
     if spending:
-        title = str(year) + " Spending: " + "${:,.2f}".format(expenses_for_year)
+        title = str(year) + " Spending: " + "${:,.2f}".format(spec.total)
     else:
-        title = str(year) + " Income: " + "${:,.2f}".format(expenses_for_year)
-    year_data.plot(
-        kind="pie",
-        figsize=(8, 8),
-        title=title,
-        colors=[colors[key] for key in year_data.index],
-    )
-    plt.legend(legend_label, loc="center right", bbox_to_anchor=(1.9, 0.5))
+        title = str(year) + " Income: " + "${:,.2f}".format(spec.total)
+    spec.series.plot(kind="pie", figsize=(8, 8), title=title, colors=spec.colors)
+    plt.legend(spec.labels, loc="center right", bbox_to_anchor=(1.9, 0.5))
 
     # Write chart to a file or stdout
     if out_file:
@@ -68,31 +107,22 @@ def visualize_average_spending_by_group(sbg, title, colors, out_file=""):
     colors - a dictionary of assigned matplotlib colormap values for each spending group
     out_file - an optional output file to write the visualization to
     """
-    # Build a legend for a Pie Chart that includes the Spending Category and the Amount
-    legend_label = []
-    average_total = sbg["Average"].sum()
-
-    for idx in sbg.index:
-        if sbg.loc[idx].Average < 0:
-            print(
-                "Average spending on "
-                + idx
-                + ": ${:,.2f}".format(sbg.loc[idx].Average)
-                + " is negative. Removing from analysis."
-            )
-            average_total -= sbg.loc[idx].Average
-            sbg.drop([idx], inplace=True)
-        else:
-            legend_label.append(idx + ": ${:,.2f}".format(sbg.loc[idx].Average))
+    spec = build_chart_spec(sbg["Average"], colors, keep_zero=True)
+    for group, amount in spec.removed.items():
+        print(
+            "Average spending on "
+            + group
+            + ": ${:,.2f}".format(amount)
+            + " is negative. Removing from analysis."
+        )
 
-    sbg.plot(
+    spec.series.plot(
         kind="pie",
-        y="Average",
         figsize=(8, 8),
-        colors=[colors[key] for key in sbg.index],
-        title=title + ": " + "${:,.2f}".format(sbg.Average.sum()),
+        colors=spec.colors,
+        title=title + ": " + "${:,.2f}".format(spec.total),
     )
-    plt.legend(legend_label, loc="center left", bbox_to_anchor=(1.5, 0.5))
+    plt.legend(spec.labels, loc="center left", bbox_to_anchor=(1.5, 0.5))
 
     if out_file:
         plt.savefig(out_file, bbox_inches="tight")
@@ -101,6 +131,124 @@ def visualize_average_spending_by_group(sbg, title, colors, out_file=""):
     plt.close()
 
 
+def visualize_spending_bands(bands, title, out_file=""):
+    """Build a chart of percentile bands of spending by year
+
+    bands - a dataframe indexed by year with a column for each percentile,
+            from lowest to highest
+    title - the title for the visualization
+    out_file - an optional output file to write the visualization to
+    """
+    columns = list(bands.columns)
+    bands.plot(y=columns[len(columns) // 2], figsize=(10, 6), title=title)
+    # Shade between each pair of percentiles, working in from the outside
+    for i in range(len(columns) // 2):
+        plt.fill_between(
+            bands.index,
+            bands[columns[i]],
+            bands[columns[-1 - i]],
+            alpha=0.2,
+            color="tab:blue",
+            label=f"{columns[i]} - {columns[-1 - i]}",
+        )
+    plt.gca().yaxis.set_major_formatter("${x:,.0f}")
+    plt.legend(loc="upper left")
+
+    if out_file:
+        plt.savefig(out_file, bbox_inches="tight")
+    else:
+        plt.show()
+    plt.close()
+
+
+def chart_hash(chart_function, **kwargs):
+    """Returns a hash of the chart function and the inputs it is called with"""
+    digest = hashlib.sha256(chart_function.__name__.encode())
+    for name, value in sorted(kwargs.items()):
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            value = value.to_json()
+        elif isinstance(value, dict):
+            value = sorted(value.items())
+        digest.update(json.dumps([name, value], default=str).encode())
+    return digest.hexdigest()
+
+
+def get_chart_data(data, colors):
+    """Returns the amounts in a series that aren't zero, and the colors of just
+    those groups.  Passing a chart only what it draws keeps its hash the same
+    when a group is added in another year
+    """
+    data = data[data != 0]
+    return data, {group: colors[group] for group in data.index}
+
+
+def read_chart_manifest(manifest_file):
+    """Returns the dict of chart files and the hash they were rendered from"""
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _render_chart(chart_function, kwargs):
+    """Render one chart to a file in a worker process"""
+    # Use the non-interactive backend, since charts are only written to files
+    plt.switch_backend("Agg")
+    chart_function(**kwargs)
+
+
+def render_charts(charts, manifest_file=None, max_workers=None):
+    """Render a list of charts to files in parallel, skipping the ones whose
+    inputs haven't changed since their file was written.
+
+    charts - a list of (chart_function, kwargs) tuples, ie:
+             (visualize_expenses_by_group, {"year": "2023", ..., "out_file": ...})
+             kwargs must include the out_file to write the chart to
+    manifest_file - where the hash of each chart's inputs is kept.  Defaults to
+             CHART_CACHE_MANIFEST in the directory of the first chart
+
+    Returns the number of charts that were rendered
+    """
+    if not len(charts):
+        return 0
+    if manifest_file is None:
+        out_dir = os.path.dirname(charts[0][1]["out_file"])
+        manifest_file = os.path.join(out_dir, CHART_CACHE_MANIFEST)
+    manifest = read_chart_manifest(manifest_file)
+
+    stale = {}
+    for chart_function, kwargs in charts:
+        out_file = kwargs["out_file"]
+        digest = chart_hash(chart_function, **kwargs)
+        if manifest.get(out_file) != digest or not os.path.isfile(out_file):
+            stale[out_file] = (chart_function, kwargs, digest)
+    if not len(stale):
+        return 0
+
+    # The charts are rendered in other processes, so CPU time isn't recorded
+    with ps.stage(
+        "render", rows_in=len(charts), files_written=list(stale), measure_cpu=False
+    ) as s:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                out_file: pool.submit(_render_chart, chart_function, kwargs)
+                for out_file, (chart_function, kwargs, _) in stale.items()
+            }
+            for future in futures.values():
+                future.result()
+        s.rows_out = len(stale)
+
+    # Re-read the manifest in case another report updated it in the meantime
+    manifest = read_chart_manifest(manifest_file)
+    manifest.update({out_file: digest for out_file, (*_, digest) in stale.items()})
+    tmp_file = f"{manifest_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+    return len(stale)
+
+
 #
 # Create an assigned color for each category so the colors are consistent
 def assign_colors_to_groups(df):
@@ -140,6 +288,35 @@ def read_structured_transactions(
     index - the column that should be used for the index in the returned dataframe
     structured_data_description - description for error messages
     """
+    check_structured_transactions(
+        structured_transactions, raw_transactions, structured_data_description
+    )
+
+    # Read the summarized annual expenses by spending group
+    try:
+        print(
+            "Reading "
+            + structured_data_description
+            + " from "
+            + structured_transactions
+        )
+        df = pd.read_csv(structured_transactions)
+        df.set_index(index, inplace=True)
+    except BaseException as e:
+        print("Failed to read " + structured_data_description + ": {}".format(e))
+        quit()
+
+    return df
+
+
+def check_structured_transactions(
+    structured_transactions,
+    raw_transactions,
+    structured_data_description="structured transaction data",
+):
+    """Exit with a message if the structured transaction data is missing or
+    older than the raw mint transaction data it was created from
+    """
     # Make sure structured is newer than raw mint data
     try:
         f1 = os.path.getmtime(structured_transactions)
@@ -168,22 +345,6 @@ def read_structured_transactions(
         print('Please run "python extract_spending_and_income.py" first.')
         quit()
 
-    # Read the summarized annual expenses by spending group
-    try:
-        print(
-            "Reading "
-            + structured_data_description
-            + " from "
-            + structured_transactions
-        )
-        df = pd.read_csv(structured_transactions)
-        df.set_index(index, inplace=True)
-    except BaseException as e:
-        print("Failed to read " + structured_data_description + ": {}".format(e))
-        quit()
-
-    return df
-
 
 def build_summary_table(df, ret_df=None):
     """Creata dataframe suitable for output as a table
@@ -221,3 +382,35 @@ def build_category_details(df, category=""):
     category_expenses = category_expenses.sort_index(axis=1)
     category_expenses.loc["Total"] = category_expenses.sum()
     return category_expenses
+
+
+def build_group_details(df):
+    """Generate a table of the annual amounts by category for each Spending
+    Group, in order of the Spending Group names
+
+    df - a dataframe of transactions with "Spending Group", "Category" and
+         "YYYY Amount" columns
+
+    The amounts for every group and category are summed with a single groupby,
+    and the result is split up into a table for each group
+    """
+    year_columns = sorted(df.filter(regex="Amount").columns)
+    totals = df.groupby(["Spending Group", "Category"])[year_columns].sum()
+    for group, group_df in totals.groupby(level="Spending Group", sort=True):
+        group_df = group_df.droplevel("Spending Group")
+        group_df.loc["Total"] = group_df.sum()
+        yield group, group_df
+
+
+def write_group_details(df, html_file, kind="spending"):
+    """Write a table of the annual amounts by category for each Spending Group
+    to an open html file as it is built
+
+    kind - the kind of transactions, ie: "spending" or "income", for the headings
+    """
+    with ps.stage("render", rows_in=len(df)):
+        for group, group_df in build_group_details(df):
+            print(
+                f"<H2><center>Details for {group} {kind}<center></H2>", file=html_file
+            )
+            print(group_df.to_html(), file=html_file)